@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import sys
+import time
+
+from cloner.configuration.Configuration import Host
+from cloner.coordinator import Action, Coordinator, host_configuration
+
+ACTIONS = [Action.STATUS, Action.START, Action.CONFIGURE, Action.STOP]
+
+
+class StandInAgent(asyncio.Protocol):
+    """
+    Answers like cloner-service-webserver.py after `delay` seconds. Agents listed as slow never answer,
+    failing ones answer 500.
+    """
+
+    def __init__(self, delay=0.0, slow=False, failing=False):
+        self.delay = delay
+        self.slow = slow
+        self.failing = failing
+        self.data = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.data += data
+        head, separator, body = self.data.partition(b"\r\n\r\n")
+        if not separator:
+            return
+        for line in head.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length" and len(body) < int(value):
+                return
+        if not self.slow:
+            asyncio.get_running_loop().call_later(self.delay, self.answer, head.split(b" ")[1])
+
+    def answer(self, path):
+        code, status = (500, "ERROR") if self.failing else (200, "OK")
+        content = json.dumps({"action": path.decode("latin-1").strip("/").upper(), "status": status,
+                              "details": None}).encode("utf-8")
+        self.transport.write(b"HTTP/1.0 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                             % (code, status.encode("latin-1"), len(content), content))
+        self.transport.close()
+
+    @staticmethod
+    def serve(listeners, delay, slow, failing):
+        async def serve_forever():
+            loop = asyncio.get_running_loop()
+            for index, listener in enumerate(listeners):
+                await loop.create_server(
+                    lambda index=index: StandInAgent(delay, index in slow, index in failing), sock=listener)
+            await asyncio.Event().wait()
+
+        asyncio.run(serve_forever())
+
+
+def start_stand_in_agents(nodes, delay=0.0, slow=(), failing=()):
+    # agents live in another process, like real nodes they don't share the event loop of the coordinator
+    listeners = []
+    for _ in range(nodes):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(128)
+        listeners.append(listener)
+    process = multiprocessing.Process(target=StandInAgent.serve, args=(listeners, delay, set(slow), set(failing)),
+                                      daemon=True)
+    process.start()
+    addresses = ["127.0.0.1:%d" % listener.getsockname()[1] for listener in listeners]
+    for listener in listeners:
+        listener.close()
+    return process, addresses
+
+
+def benchmark(nodes, concurrency, timeout, delay, slow, failing, runs):
+    process, addresses = start_stand_in_agents(nodes, delay, range(slow), range(slow, slow + failing))
+    try:
+        coordinator = Coordinator(concurrency=concurrency, timeout=timeout)
+        body = json.dumps(host_configuration(Host(target_hosts=["http://127.0.0.1:8081"]))).encode("utf-8")
+        bodies = {address: body for address in addresses}
+        results = []
+        for action in ACTIONS:
+            samples = []
+            for _ in range(runs):
+                result = coordinator.execute(action, addresses, bodies)
+                samples.append(result.elapsed)
+            summary = result.to_dict()
+            results.append({
+                "action": action,
+                "nodes": nodes,
+                "concurrency": concurrency,
+                "runs": runs,
+                "min": min(samples),
+                "mean": sum(samples) / len(samples),
+                "max": max(samples),
+                "ok": summary["ok"],
+                "errors": summary["errors"],
+                "timeouts": summary["timeouts"]
+            })
+        return results
+    finally:
+        process.terminate()
+        process.join()
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Coordinator benchmark against local stand-in agents',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=500,
+                        help='Number of stand-in agents, each on its own port.')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Maximum number of nodes called at once.')
+    parser.add_argument('--timeout', type=float, default=2.0,
+                        help='Seconds every node has to answer.')
+    parser.add_argument('--delay', type=float, default=0.05,
+                        help='Seconds every agent takes to answer.')
+    parser.add_argument('--slow', type=int, default=5,
+                        help='Number of agents which never answer.')
+    parser.add_argument('--failing', type=int, default=5,
+                        help='Number of agents which answer 500.')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs of every action.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(json.dumps({
+        "python": sys.version.split()[0],
+        "timestamp": time.time(),
+        "results": benchmark(args.nodes, args.concurrency, args.timeout, args.delay, args.slow, args.failing,
+                             args.runs)
+    }, indent=4))
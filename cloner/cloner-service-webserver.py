@@ -1,10 +1,14 @@
 import argparse
+import hmac
 import json
 import logging
 import logging.config
 import logging.handlers
 import os
+import shlex
+import shutil
 import sys
+import tempfile
 from string import Template
 from subprocess import Popen, PIPE, CalledProcessError
 
@@ -16,6 +20,15 @@ except ImportError:
     from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
     from SimpleHTTPServer import SimpleHTTPRequestHandler
 
+# pushed configurations are checked with the model of cloner_v2, which runs gor from them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cloner_v2'))
+from configuration import Configuration  # noqa: E402
+from metadata import BinaryMetadataCache  # noqa: E402
+from validator import ConfigurationValidator  # noqa: E402
+
+TOKEN_HEADER = 'X-Cloner-Token'
+MAX_CONFIGURATION_SIZE = 64 * 1024
+
 
 def get_default_logger():
     # create logger
@@ -53,6 +66,14 @@ def get_args():
     parser.add_argument('--port', type=int,
                         required=True,
                         help='Port to listening.')
+    parser.add_argument('--bind', type=str, default='',
+                        help='Address to listen on, all interfaces by default (the coordinator calls agents '
+                             'remotely), e.g. 127.0.0.1 for local access only.')
+    parser.add_argument('--configuration-path', type=str, default='cloner-configuration.json',
+                        help='Path where configuration pushed by the coordinator is saved.')
+    parser.add_argument('--token', type=str, default=os.environ.get('CLONER_AGENT_TOKEN'),
+                        help='Shared token the coordinator sends in the %s header, POST /configuration is '
+                             'refused without it. Defaults to CLONER_AGENT_TOKEN.' % TOKEN_HEADER)
     return parser.parse_args()
 
 
@@ -84,11 +105,12 @@ class ShellCommand:
         p = None
         try:
             p = Popen(self.command, stdout=PIPE, stderr=PIPE, shell=True)
-            p.wait()
+            # reads both pipes while waiting, output larger than a pipe buffer would block wait()
+            stdout, stderr = p.communicate()
 
             self.returncode = p.returncode
-            self.stdout = utf8(p.stdout.read()).strip()
-            self.stderr = utf8(p.stderr.read()).strip()
+            self.stdout = utf8(stdout).strip()
+            self.stderr = utf8(stderr).strip()
         except CalledProcessError as e:
             raise Exception("Couldn't execute command: %s - %s" % (self.command, e.output))
         except Exception as e:
@@ -102,13 +124,81 @@ class ShellCommand:
                     pass
 
 
-def run(port, server_class=HTTPServer, handler_class=BaseHTTPRequestHandler):
-    server_address = ('', port)
+def probe_gor_version(path):
+    # the path comes from PATH, run as one word whatever it contains
+    result = ShellCommand(shlex.quote(path))
+    result.execute()
+    return result.stdout, result.returncode
+
+
+# the version probe runs once per gor binary change, the cache is shared with cloner_v2/cloner.py
+GOR_METADATA = BinaryMetadataCache(probe_gor_version)
+
+
+def gor_version(command='gor'):
+    path = shutil.which(command)
+    if path is None:
+        # nothing to cache, let the shell report the error
+        result = ShellCommand(command)
+        result.execute()
+        return result
+    metadata = GOR_METADATA.get(path)
+    result = ShellCommand(command)
+    result.returncode = metadata.return_code
+    result.stdout = metadata.version
+    return result
+
+
+class ConfigurationRejected(Exception):
+    def __init__(self, code, message):
+        super(ConfigurationRejected, self).__init__(message)
+        self.code = code
+
+
+def read_configuration(headers, rfile, token):
+    """
+    Reads and checks a configuration pushed by the coordinator, raises ConfigurationRejected with the HTTP
+    code to answer otherwise. Returns the configuration as a JSON dict.
+    """
+    if not token:
+        raise ConfigurationRejected(403, "Configuration push is disabled, the agent has no token")
+    if not hmac.compare_digest(headers.get(TOKEN_HEADER) or '', token):
+        raise ConfigurationRejected(403, "Missing or incorrect %s" % TOKEN_HEADER)
+
+    try:
+        length = int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        raise ConfigurationRejected(411, "Content-Length is required")
+    if length < 0 or length > MAX_CONFIGURATION_SIZE:
+        raise ConfigurationRejected(413, "Configuration is larger than %d bytes" % MAX_CONFIGURATION_SIZE)
+
+    try:
+        dictionary = json.loads(utf8(rfile.read(length)))
+        if not isinstance(dictionary, dict):
+            raise ValueError("Configuration has to be a JSON object")
+        errors = ConfigurationValidator().validate(Configuration.from_dict(dictionary))
+    except (TypeError, ValueError, AttributeError, KeyError) as e:
+        errors = [str(e)]
+    if errors:
+        raise ConfigurationRejected(400, "Configuration has incorrect format - %s" % "; ".join(errors))
+    return dictionary
+
+
+def save_configuration(path, configuration):
+    # replaced at once, gor never sees a half written configuration
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as configuration_file:
+        json.dump(configuration, configuration_file, sort_keys=True, indent=4)
+    os.replace(configuration_file.name, path)
+
+
+def run(port, server_class=HTTPServer, handler_class=BaseHTTPRequestHandler, bind=''):
+    server_address = (bind, port)
     httpd = None
     try:
         httpd = server_class(server_address, handler_class)
 
-        LOGGER.info("Listening on port: %d", port)
+        LOGGER.info("Listening on %s:%d", bind or '*', port)
         httpd.serve_forever()
     except Exception as e:
         LOGGER.warn("Couldn't start webserver on port: %d -  %s", port, e)
@@ -127,6 +217,8 @@ class DefaultHTTPHandler(SimpleHTTPRequestHandler):
         self.end_headers()
 
     def send_content(self, content):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
         self.wfile.write(content)
 
     def send_error_404(self):
@@ -167,7 +259,6 @@ class HTTPHandler2(DefaultHTTPHandler):
     stop = ShellCommand('gor')
     restart = ShellCommand('gor')
     status = ShellCommand('gor')
-    version = ShellCommand('gor')
 
     def do_GET(self):
         try:
@@ -205,8 +296,8 @@ class HTTPHandler2(DefaultHTTPHandler):
                 self.send_response(200)
                 self.send_headers({"Content-type": "application/json; charset=utf-8"})
 
-                self.version.execute()
-                content = self.get_json_content("STATUS", self.version)
+                version = gor_version()
+                content = self.get_json_content("STATUS", version)
                 self.send_content(content)
                 return
 
@@ -214,11 +305,11 @@ class HTTPHandler2(DefaultHTTPHandler):
                 self.send_response(200)
                 self.send_headers({"Content-type": "application/json; charset=utf-8"})
 
-                self.version.execute()
+                version = gor_version()
                 content = json.dumps({
                     "action": "VERSION",
                     "status": "OK",
-                    "details": self.version.stdout
+                    "details": version.stdout
                 })
                 self.send_content(content)
                 return
@@ -230,8 +321,33 @@ class HTTPHandler2(DefaultHTTPHandler):
         self.send_error_404()
         return
 
+    def do_POST(self):
+        try:
+            if self.path == "/configuration":
+                configuration = read_configuration(self.headers, self.rfile, ARGS.token)
+                save_configuration(ARGS.configuration_path, configuration)
+
+                self.send_response(200)
+                self.send_headers({"Content-type": "application/json; charset=utf-8"})
+                self.send_content(json.dumps({
+                    "action": "CONFIGURATION",
+                    "status": "OK",
+                    "details": ARGS.configuration_path
+                }))
+                return
+        except ConfigurationRejected as e:
+            LOGGER.warn("Rejected configuration from %s - %s", self.client_address[0], e)
+            self.send_error(e.code, str(e))
+            return
+        except Exception as e:
+            self.send_error_500(e)
+            return
+
+        self.send_error_404()
+        return
+
     def get_json_content(self, action, command_result):
-        if self.version.returncode == 0:
+        if command_result.returncode == 0:
             content = {
                 "action": action,
                 "status": "OK",
@@ -247,7 +363,7 @@ class HTTPHandler2(DefaultHTTPHandler):
 
 
 def main():
-    run(ARGS.port, HTTPServer, HTTPHandler2)
+    run(ARGS.port, HTTPServer, HTTPHandler2, ARGS.bind)
 
 
 if __name__ == '__main__':
@@ -126,26 +126,27 @@ class ConfigurationWriter:
             configuration_file.write(configuration.to_json())
 
 
-configuration = Configuration()
-monitor = HaProxyMonitor("http://localhost:9090/content/csv")
-monitor.name = "xxx"
-configuration.add_haproxy_monitor("localhost-8080", monitor)
-configuration.add_haproxy_monitor("localhost-9090", monitor)
-
-cluster = Cluster()
-cluster.always_running = True
-cluster.haproxy_backend_name = "backend-name-1"
-cluster.haproxy_monitor = "localhost-9090"
-
-host = Host()
-cluster.add_host("localhost.domain", host)
-cluster.add_hosts(("localhost-1.domain", "localhost-2.domain"), host)
-
-configuration.add_cluster("cluster-1", cluster)
-configuration.add_cluster("cluster-2", cluster)
-
-ConfigurationWriter.write("sample_configuration.json", configuration)
-
-hpm = HaProxyMonitor("url")
-hpm.name = "xxx"
-print(hpm)
+if __name__ == '__main__':
+    configuration = Configuration()
+    monitor = HaProxyMonitor("http://localhost:9090/content/csv")
+    monitor.name = "xxx"
+    configuration.add_haproxy_monitor("localhost-8080", monitor)
+    configuration.add_haproxy_monitor("localhost-9090", monitor)
+
+    cluster = Cluster()
+    cluster.always_running = True
+    cluster.haproxy_backend_name = "backend-name-1"
+    cluster.haproxy_monitor = "localhost-9090"
+
+    host = Host()
+    cluster.add_host("localhost.domain", host)
+    cluster.add_hosts(("localhost-1.domain", "localhost-2.domain"), host)
+
+    configuration.add_cluster("cluster-1", cluster)
+    configuration.add_cluster("cluster-2", cluster)
+
+    ConfigurationWriter.write("sample_configuration.json", configuration)
+
+    hpm = HaProxyMonitor("url")
+    hpm.name = "xxx"
+    print(hpm)
@@ -2,7 +2,8 @@ import os
 import sys
 
 from cloner.configuration.Configuration import ConfigurationReader, Configuration
-from haproxy.HaProxy import HaProxy, Status
+from haproxy.HaProxy import Status
+from haproxy.Poller import Poller
 
 
 class HostToUpdate:
@@ -22,6 +23,9 @@ class ConfigurationUpdater:
     def save(self):
         pass
 
+    def close(self):
+        pass
+
 
 class NotFoundHaProxyMonitor(Exception):
     pass
@@ -29,6 +33,8 @@ class NotFoundHaProxyMonitor(Exception):
 
 class FileConfigurationUpdater(ConfigurationUpdater):
     max_downtime_minutes = 20
+    poll_concurrency = 16
+    poll_timeout = 10.0
 
     __configuration = Configuration()
     __haproxy_monitors = {}
@@ -36,8 +42,13 @@ class FileConfigurationUpdater(ConfigurationUpdater):
 
     def __init__(self, configuration_path):
         self.configuration_path = configuration_path
+        # kept for every load(), so connections to the monitors stay alive between them
+        self.poller = Poller(self.poll_concurrency, self.poll_timeout)
         print(configuration_path)
 
+    def close(self):
+        self.poller.close()
+
     def load(self):
         self.__configuration = self.__load_configuration()
         print("Loaded configuration")
@@ -48,16 +59,17 @@ class FileConfigurationUpdater(ConfigurationUpdater):
         return ConfigurationReader.read(self.configuration_path)
 
     def __load_haproxy_monitors(self):
-        haproxy_monitors = {}
-        for name in self.__configuration.get_haproxy_monitors_names():
-            print(name)
-            haproxy_monitor = self.__configuration.get_haproxy_monitor(name)
+        urls = {name: self.__configuration.get_haproxy_monitor(name).url
+                for name in self.__configuration.get_haproxy_monitors_names()}
 
-            haproxy = HaProxy()
-            haproxy.load_from_url(haproxy_monitor.url)
-
-            haproxy_monitors[name] = haproxy
-            print("Loaded HaProxy monitor for %s " % name)
+        haproxy_monitors = {}
+        for name, result in self.poller.poll(urls).items():
+            if result.ok():
+                haproxy_monitors[name] = result.haproxy
+                print("Loaded HaProxy monitor for %s in %.3fs" % (name, result.latency))
+            else:
+                # clusters of this monitor report it as not found in check()
+                print("Couldn't load HaProxy monitor for %s in %.3fs - %s" % (name, result.latency, result.error))
 
         return haproxy_monitors
 
@@ -114,9 +126,12 @@ def main():
     configuration_path = "sample_configuration.json"
 
     updater = FileConfigurationUpdater(configuration_path)
-    updater.load()
-    updater.check()
-    updater.save()
+    try:
+        updater.load()
+        updater.check()
+        updater.save()
+    finally:
+        updater.close()
 
     pass
 
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from cloner.configuration.Configuration import ConfigurationReader
+
+
+# header with the token shared with cloner agents, required by POST /configuration
+TOKEN_HEADER = "X-Cloner-Token"
+
+
+class Action:
+    START = "start"
+    STOP = "stop"
+    RESTART = "restart"
+    STATUS = "status"
+    VERSION = "version"
+    CONFIGURE = "configure"
+
+    ALL = (START, STOP, RESTART, STATUS, VERSION, CONFIGURE)
+
+
+class NodeResult:
+    OK = "OK"
+    ERROR = "ERROR"
+    TIMEOUT = "TIMEOUT"
+
+    def __init__(self, node, action, status, code=None, details=None, elapsed=0.0):
+        self.node = node
+        self.action = action
+        self.status = status
+        self.code = code
+        self.details = details
+        self.elapsed = elapsed
+
+    def to_dict(self):
+        return {
+            "node": self.node,
+            "action": self.action,
+            "status": self.status,
+            "code": self.code,
+            "details": self.details,
+            "elapsed": self.elapsed
+        }
+
+
+class ClusterResult:
+    def __init__(self, action, results, elapsed):
+        self.action = action
+        self.results = results
+        self.elapsed = elapsed
+
+    def count(self, status):
+        return sum(1 for result in self.results if result.status == status)
+
+    def failed(self):
+        return [result for result in self.results if result.status != NodeResult.OK]
+
+    def to_dict(self):
+        elapsed = sorted(result.elapsed for result in self.results)
+        return {
+            "action": self.action,
+            "nodes": len(self.results),
+            "ok": self.count(NodeResult.OK),
+            "errors": self.count(NodeResult.ERROR),
+            "timeouts": self.count(NodeResult.TIMEOUT),
+            "elapsed": self.elapsed,
+            "slowest_node": elapsed[-1] if elapsed else None,
+            "failed": [result.to_dict() for result in self.failed()],
+            "results": [result.to_dict() for result in self.results]
+        }
+
+
+class Coordinator:
+    """
+    Sends one action to the cloner agents (cloner-service-webserver.py) of many nodes at once.
+    At most `concurrency` nodes are called at the same time and every node has `timeout` seconds
+    to connect and answer, so a 500 node cluster takes about 500 / concurrency * (slowest answer).
+    """
+
+    def __init__(self, agent_port=8000, concurrency=64, timeout=5.0, token=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.agent_port = agent_port
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.token = token
+
+    def address(self, node):
+        host, _, port = node.rpartition(":")
+        if host and port.isdigit():
+            return host, int(port)
+        return node, self.agent_port
+
+    async def _request(self, node, method, path, body=None):
+        host, port = self.address(node)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            body = body or b""
+            token = "%s: %s\r\n" % (TOKEN_HEADER, self.token) if self.token else ""
+            writer.write(("%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n"
+                          "Content-Length: %d\r\n%sConnection: close\r\n\r\n"
+                          % (method, path, host, len(body), token)).encode("latin-1") + body)
+            response = await reader.read()
+        finally:
+            writer.close()
+
+        head, _, content = response.partition(b"\r\n\r\n")
+        status_line = head.split(b"\r\n", 1)[0].split(b" ", 2)
+        if len(status_line) < 2 or not status_line[1].isdigit():
+            raise ValueError("Incorrect response %r" % head[:64])
+        return int(status_line[1]), content.decode("utf-8", errors="replace")
+
+    async def _call(self, semaphore, node, action, method, path, body):
+        async with semaphore:
+            started_at = time.monotonic()
+            try:
+                code, content = await asyncio.wait_for(self._request(node, method, path, body), self.timeout)
+                try:
+                    details = json.loads(content)
+                except ValueError:
+                    details = content
+                status = NodeResult.OK if code == 200 else NodeResult.ERROR
+                return NodeResult(node, action, status, code, details, time.monotonic() - started_at)
+            except asyncio.TimeoutError:
+                return NodeResult(node, action, NodeResult.TIMEOUT, details="No answer in %.1fs" % self.timeout,
+                                  elapsed=time.monotonic() - started_at)
+            except (OSError, ValueError) as e:
+                return NodeResult(node, action, NodeResult.ERROR, details=str(e),
+                                  elapsed=time.monotonic() - started_at)
+
+    async def run(self, action, nodes, bodies=None) -> ClusterResult:
+        """
+        Calls the action on every node, bodies maps nodes to the configurations pushed by CONFIGURE.
+        """
+        if action not in Action.ALL:
+            raise ValueError("Unknown action %s, expects one of %s" % (action, ", ".join(Action.ALL)))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started_at = time.monotonic()
+        if Action.CONFIGURE == action:
+            calls = [self._call(semaphore, node, action, "POST", "/configuration", (bodies or {}).get(node))
+                     for node in nodes]
+        else:
+            calls = [self._call(semaphore, node, action, "GET", "/%s" % action, None) for node in nodes]
+        result = ClusterResult(action, await asyncio.gather(*calls), time.monotonic() - started_at)
+
+        self.logger.info("[%s] %d node(s) in %.3fs - %d OK, %d error(s), %d timeout(s)" % (
+            action.upper(), len(result.results), result.elapsed, result.count(NodeResult.OK),
+            result.count(NodeResult.ERROR), result.count(NodeResult.TIMEOUT)))
+        return result
+
+    def execute(self, action, nodes, bodies=None) -> ClusterResult:
+        return asyncio.run(self.run(action, nodes, bodies))
+
+
+def cluster_nodes(configuration, cluster_name):
+    return list(configuration.get_cluster(cluster_name).get_hostdomains())
+
+
+def host_configuration(host):
+    """
+    cloner_v2 configuration (the one agents validate and run gor from) of a cluster host.
+    """
+    extra_args = {"--output-http-timeout": host.http_timeout} if host.http_timeout else {}
+    if host.save_responses:
+        extra_args["--output-http-track-response"] = "true"
+    return {
+        "input": {
+            "type": "raw",
+            "port": host.listen_port,
+            "paths": {
+                "allow": list(host.allow_url_paths or []),
+                "disallow": list(host.disallow_url_paths or []),
+                "rewrite": list(host.url_rewrite_paths or [])
+            }
+        },
+        "output": {
+            "http": {
+                "hosts": [{"host": target_host} for target_host in host.target_hosts],
+                "rate": host.traffic_rate
+            }
+        },
+        "extra_args": extra_args or None
+    }
+
+
+def cluster_configurations(configuration, cluster_name):
+    """
+    Configuration of every host of a cluster, as JSON bodies for Action.CONFIGURE.
+    """
+    cluster = configuration.get_cluster(cluster_name)
+    return {hostdomain: json.dumps(host_configuration(cluster.get_host(hostdomain)), sort_keys=True).encode("utf-8")
+            for hostdomain in cluster.get_hostdomains()}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Sends start/stop/status/configuration to cloner agents of a cluster in parallel',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration-path', type=str, required=True,
+                        help='Path to configuration with clusters.')
+    parser.add_argument('--cluster', type=str, required=True,
+                        help='Name of the cluster.')
+    parser.add_argument('--action', type=str, required=True, choices=Action.ALL,
+                        help='Action sent to every node of the cluster.')
+    parser.add_argument('--agent-port', type=int, default=8000,
+                        help='Port of cloner agents.')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Maximum number of nodes called at once.')
+    parser.add_argument('--timeout', type=float, default=5.0,
+                        help='Seconds every node has to answer.')
+    parser.add_argument('--token', type=str, default=os.environ.get('CLONER_AGENT_TOKEN'),
+                        help='Token shared with cloner agents. Defaults to CLONER_AGENT_TOKEN.')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = get_args()
+
+    configuration = ConfigurationReader.read(args.configuration_path)
+    nodes = cluster_nodes(configuration, args.cluster)
+    bodies = cluster_configurations(configuration, args.cluster) if Action.CONFIGURE == args.action else None
+
+    coordinator = Coordinator(args.agent_port, args.concurrency, args.timeout, args.token)
+    result = coordinator.execute(args.action, nodes, bodies)
+    print(json.dumps(result.to_dict(), indent=4))
+    return 0 if not result.failed() else 1
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import copy
+import json
+import multiprocessing
+import os
+import re
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+from capture import GorRecord, PayloadType, write_records
+from cloner import Cloner
+from command import Command
+from configuration import Configuration, ConfigurationReader, Paths
+from gor import GorCommand
+from paths import PathRules, go_replacement
+from replay import Replayer
+from validator import Validator
+
+__version__ = "0.1"
+
+__all__ = ["Benchmark"]
+
+BENCHMARKS = ["build", "load", "startup", "stop", "force_stop", "replay", "paths"]
+
+EXAMPLE_CONFIGURATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_cloner_service_in.json")
+FAKE_GOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_gor.py")
+
+# environment of fake_gor.py per scenario
+SCENARIOS = {
+    "default": {},
+    "slow_exit": {"FAKE_GOR_EXIT_DELAY": "0.2"},
+    "ignore_sigterm": {"FAKE_GOR_IGNORE_SIGTERM": "1"},
+    "flood_stdout": {"FAKE_GOR_FLOOD": "1"}
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(name, samples, **parameters):
+    return {
+        "name": name,
+        "parameters": parameters,
+        "runs": len(samples),
+        "min": min(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "max": max(samples)
+    }
+
+
+def measure(function, runs):
+    samples = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started_at)
+    return samples
+
+
+def clear_validation_caches():
+    Validator.cache_clear()
+
+
+def configuration_of_size(hosts, paths=None) -> Configuration:
+    configuration = ConfigurationReader.read(EXAMPLE_CONFIGURATION)
+    configuration = copy.deepcopy(configuration)
+    paths = hosts if paths is None else paths
+    configuration.output.http.hosts = [{"host": "http://host-%d.domain.com:8080" % index} for index in range(hosts)]
+    configuration.output.tcp.hosts = [{"host": "host-%d.domain.com:12345" % index, "rate": "10%"}
+                                      for index in range(hosts)]
+    configuration.input.paths.allow = ["/allow/%d" % index for index in range(paths)]
+    configuration.input.paths.disallow = ["/disallow/%d" % index for index in range(paths)]
+    configuration.input.paths.rewrite = ["/rewrite/%d/([a-z]+):/target/%d/$1" % (index, index) for index in range(paths)]
+    return configuration
+
+
+class SequentialPathRules:
+    """
+    Baseline for PathRules: every rule is a separate regular expression, tried one after another.
+    """
+
+    def __init__(self, paths: Paths):
+        self.allow = [re.compile(path) for path in paths.allow]
+        self.disallow = [re.compile(path) for path in paths.disallow]
+        self.rewrite = [(re.compile(path.split(":")[0]), go_replacement(path.split(":")[1])) for path in paths.rewrite]
+
+    def apply(self, path):
+        if self.allow and not any(rule.search(path) for rule in self.allow):
+            return None
+        if any(rule.search(path) for rule in self.disallow):
+            return None
+        for pattern, replacement in self.rewrite:
+            if pattern.search(path):
+                return pattern.sub(replacement, path)
+        return path
+
+
+class StandInServer(asyncio.Protocol):
+    """
+    Answers every request with an empty 200, keeping the connection alive. Handles requests without a body.
+    """
+    RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        requests = data.count(b"\r\n\r\n")
+        if requests:
+            self.transport.write(self.RESPONSE * requests)
+
+    @staticmethod
+    def serve(listener):
+        async def serve_forever():
+            server = await asyncio.get_running_loop().create_server(StandInServer, sock=listener)
+            await server.serve_forever()
+
+        asyncio.run(serve_forever())
+
+
+def start_stand_in_server():
+    # a separate process, so the server doesn't share the core of the replayer
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1024)
+    port = listener.getsockname()[1]
+    process = multiprocessing.Process(target=StandInServer.serve, args=(listener,), daemon=True)
+    process.start()
+    listener.close()
+    return process, port
+
+
+class Benchmark:
+    def __init__(self, runs=5, stop_timeout=1.0):
+        self.runs = runs
+        self.stop_timeout = stop_timeout
+        self.directory = tempfile.mkdtemp(prefix="cloner-benchmark-")
+        self.gor_path = self._write_executable("gor", "#!/bin/sh\nexec %s %s \"$@\"\n" % (sys.executable, FAKE_GOR))
+
+    def _write_executable(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as executable:
+            executable.write(content)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return path
+
+    def build(self, sizes=(10, 100, 1000, 10000)):
+        results = []
+        for size in sizes:
+            gor_command = GorCommand(configuration_of_size(size), gor_path=self.gor_path, as_root=False)
+
+            def cold_build():
+                clear_validation_caches()
+                gor_command.build()
+
+            results.append(summary("gor_command.build.cold", measure(cold_build, self.runs), hosts=size))
+            results.append(summary("gor_command.build.warm", measure(gor_command.build, self.runs), hosts=size))
+        return results
+
+    def load(self, sizes=(10, 1000, 10000)):
+        results = []
+        for size in sizes:
+            path = os.path.join(self.directory, "configuration-%d.json" % size)
+            with open(path, "w") as configuration_file:
+                configuration_file.write(configuration_of_size(size).to_json())
+
+            def cold_read():
+                ConfigurationReader.clear_cache()
+                ConfigurationReader.read(path)
+
+            results.append(summary("configuration_reader.read.cold", measure(cold_read, self.runs), hosts=size))
+            results.append(summary("configuration_reader.read.cached",
+                                   measure(lambda: ConfigurationReader.read(path), self.runs), hosts=size))
+        return results
+
+    def _configuration(self):
+        return configuration_of_size(3, paths=2)
+
+    def startup(self):
+        args = GorCommand(self._configuration(), gor_path=self.gor_path, as_root=False).build()
+
+        def start_and_stop():
+            command = Command(args, stop_timeout=self.stop_timeout, handle_signals=False)
+            started_at = time.perf_counter()
+            thread = threading.Thread(target=command.execute, daemon=True)
+            thread.start()
+            command.started.wait()
+            elapsed = time.perf_counter() - started_at
+            command.terminate()
+            command.request_stop()
+            thread.join()
+            return elapsed
+
+        samples = [start_and_stop() for _ in range(self.runs)]
+        return [summary("command.execute.startup", samples)]
+
+    def _started_cloner(self, scenario):
+        os.environ.update(SCENARIOS[scenario])
+        try:
+            cloner = Cloner(self._configuration(), gor_path=self.gor_path, as_root=False, stop_timeout=self.stop_timeout)
+            cloner.start()
+            cloner.gor_command.started.wait()
+            # give the interpreter of the fake gor time to install its signal handlers
+            time.sleep(0.2)
+            return cloner
+        finally:
+            for name in SCENARIOS[scenario]:
+                os.environ.pop(name)
+
+    def stop(self):
+        results = []
+        for scenario in SCENARIOS:
+            samples = []
+            for _ in range(self.runs):
+                cloner = self._started_cloner(scenario)
+                started_at = time.perf_counter()
+                cloner.stop()
+                samples.append(time.perf_counter() - started_at)
+            results.append(summary("cloner.stop", samples, scenario=scenario,
+                                   stage=cloner.gor_command.termination.stage))
+        return results
+
+    def force_stop(self):
+        results = []
+        for scenario in SCENARIOS:
+            samples = []
+            for _ in range(self.runs):
+                cloner = self._started_cloner(scenario)
+                started_at = time.perf_counter()
+                cloner.force_stop()
+                cloner.gor_command.exited.wait()
+                samples.append(time.perf_counter() - started_at)
+                cloner.stop()
+            results.append(summary("cloner.force_stop", samples, scenario=scenario))
+        return results
+
+    def paths(self, sizes=(10, 100, 1000, 10000), requests=2000):
+        """
+        Cost of filtering and rewriting one request path with a growing number of rules, combined against
+        sequential matching.
+        """
+        results = []
+        for size in sizes:
+            configuration = configuration_of_size(1, paths=size)
+            paths = configuration.input.paths
+            samples = ["/allow/%d/abc?x=1" % (index * 7919 % size) for index in range(requests // 2)]
+            samples += ["/rewrite/%d/abc" % (index * 7919 % size) for index in range(requests // 4)]
+            samples += ["/disallow/%d/abc" % (index * 7919 % size) for index in range(requests // 4)]
+
+            def cold_compile():
+                PathRules(paths).apply("/allow/0")
+
+            results.append(summary("path_rules.compile", measure(cold_compile, self.runs), rules=size * 3))
+            for name, rules in (("path_rules.apply", PathRules(paths)),
+                                ("path_rules.apply.sequential", SequentialPathRules(paths))):
+                def apply_all():
+                    for sample in samples:
+                        rules.apply(sample)
+
+                apply_all()
+                result = summary(name, [sample / len(samples) for sample in measure(apply_all, self.runs)],
+                                 rules=size * 3)
+                results.append(result)
+        return results
+
+    def _write_capture(self, requests):
+        path = os.path.join(self.directory, "requests-%d.gor" % requests)
+        paths = ["/allow/%d/item" % index for index in range(8)] + ["/disallow/0/item", "/rewrite/1/abc"]
+        write_records(path, (GorRecord(PayloadType.REQUEST, b"%x" % index, 1000000 * index,
+                                       b"GET %s?id=%d HTTP/1.1\r\nHost: production\r\nUser-Agent: benchmark\r\n\r\n"
+                                       % (paths[index % len(paths)].encode(), index))
+                             for index in range(requests)))
+        return path
+
+    def replay(self, requests=50000):
+        """
+        Replays a synthetic capture as fast as possible to a local stand-in server, reports requests per second.
+        """
+        path = self._write_capture(requests)
+        server, port = start_stand_in_server()
+        try:
+            configuration = configuration_of_size(1, paths=4)
+            configuration.output.http.hosts = [{"host": "http://127.0.0.1:%d" % port}]
+            configuration.output.split_traffic = False
+
+            samples, rates, cpu_rates = [], [], []
+            for _ in range(self.runs):
+                cpu_started_at = time.process_time()
+                stats = asyncio.run(Replayer(configuration, speed=0).replay(path))
+                samples.append(stats.finished_at - stats.started_at)
+                rates.append(stats.sent / samples[-1])
+                # per core of the replayer, the stand-in server may share the machine
+                cpu_rates.append(stats.sent / (time.process_time() - cpu_started_at))
+            result = summary("replayer.replay", samples, requests=requests)
+            result["requests_per_second"] = {"min": min(rates), "mean": sum(rates) / len(rates), "max": max(rates)}
+            result["requests_per_cpu_second"] = {"min": min(cpu_rates), "mean": sum(cpu_rates) / len(cpu_rates),
+                                                 "max": max(cpu_rates)}
+            result["errors"] = stats.errors
+            return [result]
+        finally:
+            server.terminate()
+            server.join()
+
+    def run(self, names):
+        results = []
+        for name in names:
+            results += getattr(self, name)()
+        return results
+
+
+def compare(baseline, results):
+    """
+    Adds the ratio of every mean to the mean of the same benchmark (name and parameters) in the baseline.
+    """
+    baseline_means = {(result["name"], json.dumps(result["parameters"], sort_keys=True)): result["mean"]
+                      for result in baseline["results"]}
+    for result in results:
+        baseline_mean = baseline_means.get((result["name"], json.dumps(result["parameters"], sort_keys=True)))
+        if baseline_mean:
+            result["baseline_mean"] = baseline_mean
+            result["ratio"] = result["mean"] / baseline_mean
+    return results
+
+
+def get_args(benchmarks):
+    parser = argparse.ArgumentParser(
+        description='Cloner benchmarks',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs of every benchmark.')
+    parser.add_argument('--stop-timeout', type=float, default=1.0,
+                        help='Seconds between SIGTERM and SIGKILL.')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Path to JSON results of a previous run to compare with.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Path to JSON results, stdout by default.')
+    parser.add_argument('--benchmark', action='append', choices=benchmarks, dest='benchmarks',
+                        help='Benchmark to run, may be repeated. All benchmarks by default.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args(BENCHMARKS)
+    results = {
+        "python": sys.version.split()[0],
+        "timestamp": time.time(),
+        "results": Benchmark(args.runs, args.stop_timeout).run(args.benchmarks or BENCHMARKS)
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(json.load(baseline), results["results"])
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
@@ -0,0 +1,251 @@
+import argparse
+import copy
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from configuration import InputFile, InputType
+
+__version__ = "0.1"
+
+__all__ = ["CaptureSegment", "CaptureSegments", "GorRecord", "PayloadType", "output_file_path", "read_records",
+           "write_records"]
+
+# gor separates payloads of a capture file with "\n🐵🙈🙉\n"
+SEPARATOR = "\n\U0001f435\U0001f648\U0001f649\n".encode("utf-8")
+CHUNK_SIZE = 1024 * 1024
+# strftime-like patterns gor replaces in --output-file paths, e.g. requests_%Y%m%d%H.gor
+TIME_PATTERN = re.compile(r"(%[A-Za-z]+)+")
+# gor appends "_<index>" before the extension of every chunk: requests_0.gor, requests.gor_1.gz
+FILE_INDEX = re.compile(r"_(\d+)$")
+
+
+class PayloadType:
+    REQUEST = b"1"
+    RESPONSE = b"2"
+    REPLAYED_RESPONSE = b"3"
+
+
+class GorRecord:
+    """
+    One payload of a capture file: "<type> <id> <timestamp in ns> [latency]" line followed by raw HTTP.
+    """
+    __slots__ = ("type", "id", "timestamp", "payload")
+
+    def __init__(self, type, id, timestamp, payload):
+        self.type = type
+        self.id = id
+        self.timestamp = timestamp
+        self.payload = payload
+
+    @classmethod
+    def parse(cls, data):
+        header, _, payload = data.partition(b"\n")
+        fields = header.split(b" ")
+        if len(fields) < 3:
+            return None
+        return cls(fields[0], fields[1], int(fields[2]), payload)
+
+    def to_bytes(self):
+        return b"%s %s %d\n%s" % (self.type, self.id, self.timestamp, self.payload)
+
+
+def output_file_path(output_file):
+    # gor gzips output files ending with .gz
+    if output_file.compress and not output_file.path.endswith(".gz"):
+        return output_file.path + ".gz"
+    return output_file.path
+
+
+class CaptureSegment:
+    __slots__ = ("path", "size", "mtime", "index")
+
+    def __init__(self, path, size, mtime, index):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.index = index
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "size": self.size,
+            "mtime": self.mtime,
+            "index": self.index
+        }
+
+
+class CaptureSegments:
+    """
+    Files written by gor's --output-file: one per time pattern and size chunk. Lists them in recording order,
+    removes the oldest ones over a size, count or age limit and prepares replays of a time window.
+    The newest segment may still be written by gor, so it is never removed.
+    """
+
+    def __init__(self, path):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.extension = os.path.splitext(path)[1]
+
+    def pattern(self):
+        base = TIME_PATTERN.sub("*", self.path[:len(self.path) - len(self.extension)])
+        return base + "*" + self.extension
+
+    def _order(self, path):
+        name = os.path.splitext(path)[0]
+        match = FILE_INDEX.search(name)
+        if match:
+            return name[:match.start()], int(match.group(1))
+        return name, -1
+
+    def segments(self):
+        segments = []
+        for path in glob.glob(self.pattern()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed in the meantime
+                continue
+            segments.append(CaptureSegment(path, stat.st_size, stat.st_mtime, self._order(path)[1]))
+        segments.sort(key=lambda segment: self._order(segment.path))
+        return segments
+
+    def total_size(self):
+        return sum(segment.size for segment in self.segments())
+
+    def select(self, since=None, until=None):
+        """
+        Segments with traffic recorded between since and until (unix timestamps). A segment is written
+        from the mtime of the previous one up to its own mtime.
+        """
+        selected = []
+        started_at = None
+        for segment in self.segments():
+            if (since is None or segment.mtime >= since) and (until is None or started_at is None
+                                                               or started_at < until):
+                selected.append(segment)
+            started_at = segment.mtime
+        return selected
+
+    def prune(self, max_bytes=None, max_segments=None, max_age=None, now=None):
+        segments = self.segments()
+        total_size = sum(segment.size for segment in segments)
+        now = now or time.time()
+
+        removed = []
+        for segment in segments[:-1]:
+            kept = len(segments) - len(removed)
+            if not ((max_bytes is not None and total_size > max_bytes)
+                    or (max_segments is not None and kept > max_segments)
+                    or (max_age is not None and now - segment.mtime > max_age)):
+                continue
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+            total_size -= segment.size
+            removed.append(segment)
+            self.logger.info("[PRUNE] Removed segment %s (%d bytes)" % (segment.path, segment.size))
+        return removed
+
+    def stage(self, segments, directory=None):
+        """
+        Links segments into a directory as replay_<n>, so one --input-file glob replays exactly them in order.
+        """
+        directory = directory or tempfile.mkdtemp(prefix="cloner-replay-")
+        os.makedirs(directory, exist_ok=True)
+        for index, segment in enumerate(segments):
+            os.symlink(os.path.abspath(segment.path),
+                       os.path.join(directory, "replay_%06d%s" % (index, self.extension)))
+        return os.path.join(directory, "replay_*" + self.extension)
+
+    def replay(self, configuration, speed=None, loop=False, since=None, until=None, directory=None):
+        """
+        Returns a copy of the configuration which replays recorded segments, e.g. speed="200%" for 2x.
+        Outputs are kept, point them at a staging target.
+        """
+        if since is None and until is None:
+            path = self.pattern()
+        else:
+            segments = self.select(since, until)
+            if not segments:
+                raise ValueError("No segments of %s recorded between %s and %s" % (self.path, since, until))
+            path = self.stage(segments, directory)
+
+        replay = copy.deepcopy(configuration)
+        replay.input.type = InputType.FILE
+        replay.input.port = 0
+        replay.input.file = InputFile(path, speed, loop)
+        # a replay must not record itself again
+        replay.output.file = None
+        return replay
+
+
+def capture_files(path):
+    if glob.has_magic(path):
+        return [segment.path for segment in CaptureSegments(path).segments()]
+    return [path]
+
+
+def read_records(path, chunk_size=CHUNK_SIZE):
+    """
+    Streams records of a capture file, a .gz one or every file matching a glob, in recording order.
+    """
+    for file_path in capture_files(path):
+        opener = gzip.open if file_path.endswith(".gz") else open
+        with opener(file_path, "rb") as capture_file:
+            rest = b""
+            while True:
+                chunk = capture_file.read(chunk_size)
+                if not chunk:
+                    break
+                parts = (rest + chunk).split(SEPARATOR)
+                rest = parts.pop()
+                for part in parts:
+                    record = GorRecord.parse(part)
+                    if record:
+                        yield record
+            if rest.strip():
+                record = GorRecord.parse(rest.rstrip(b"\n"))
+                if record:
+                    yield record
+
+
+def write_records(path, records):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as capture_file:
+        for record in records:
+            capture_file.write(record.to_bytes())
+            capture_file.write(SEPARATOR)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Capture segments',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--path', type=str, required=True,
+                        help='Output file path of gor, with time patterns.')
+    parser.add_argument('--prune', action='store_true',
+                        help='Remove the oldest segments over the limits.')
+    parser.add_argument('--max-bytes', type=int, default=None,
+                        help='Keep at most that many bytes of segments.')
+    parser.add_argument('--max-segments', type=int, default=None,
+                        help='Keep at most that many segments.')
+    parser.add_argument('--max-age', type=float, default=None,
+                        help='Remove segments older than that many seconds.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = get_args()
+
+    capture = CaptureSegments(args.path)
+    if args.prune:
+        capture.prune(args.max_bytes, args.max_segments, args.max_age)
+    print(json.dumps([segment.to_dict() for segment in capture.segments()], indent=4))
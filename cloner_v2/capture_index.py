@@ -0,0 +1,269 @@
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import zlib
+
+from capture import SEPARATOR, GorRecord, PayloadType
+
+__version__ = "0.1"
+
+__all__ = ["CaptureIndex", "CaptureIndexer", "IndexEntry", "IndexException"]
+
+MAGIC = b"GORIDX01"
+# magic, size and mtime of the indexed capture file, number of entries
+HEADER = struct.Struct("<8sQqQ")
+# offset and length of the record, timestamp in ns, crc32 of the first path segment, payload type, method
+ENTRY = struct.Struct("<QIqIBB2x")
+
+METHODS = (b"", b"GET", b"POST", b"PUT", b"DELETE", b"PATCH", b"HEAD", b"OPTIONS", b"CONNECT", b"TRACE")
+METHOD_CODES = {method: code for code, method in enumerate(METHODS)}
+PAYLOAD_TYPES = {PayloadType.REQUEST: 1, PayloadType.RESPONSE: 2, PayloadType.REPLAYED_RESPONSE: 3}
+# header line of a record and, for requests, the method and the first path segment of the request line
+RECORD = rb"(\d) [^ \n]* (-?\d+)[^\n]*\n(?:([A-Z]+) (/?[^/? \r\n]*))?"
+FIRST_RECORD = re.compile(RECORD)
+NEXT_RECORD = re.compile(re.escape(SEPARATOR) + RECORD)
+
+
+class IndexException(Exception):
+    pass
+
+
+def path_hash(path):
+    """
+    crc32 of the first segment of a path: "/api/users?id=1" -> crc32(b"/api").
+    """
+    if isinstance(path, str):
+        path = path.encode("latin-1")
+    end = len(path)
+    for delimiter in (b"/", b"?"):
+        position = path.find(delimiter, 1)
+        if position != -1:
+            end = min(end, position)
+    return zlib.crc32(path[:end])
+
+
+class IndexEntry:
+    __slots__ = ("offset", "length", "timestamp", "path_hash", "type", "method")
+
+    def __init__(self, offset, length, timestamp, path_hash, type, method):
+        self.offset = offset
+        self.length = length
+        self.timestamp = timestamp
+        self.path_hash = path_hash
+        self.type = type
+        self.method = method
+
+    def to_dict(self):
+        return {
+            "offset": self.offset,
+            "length": self.length,
+            "timestamp": self.timestamp,
+            "path_hash": self.path_hash,
+            "type": self.type,
+            "method": METHODS[self.method].decode("ascii")
+        }
+
+
+def index_path(capture_path):
+    return capture_path + ".idx"
+
+
+class CaptureIndexer:
+    """
+    Builds the sidecar index of a capture file in one pass over a memory map: one regular expression finds
+    separators, header lines and request lines, payloads are never copied.
+    Entries are ordered by timestamp, gor may write concurrent requests slightly out of order.
+    """
+
+    def __init__(self, capture_path):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.capture_path = capture_path
+
+    def build(self):
+        if self.capture_path.endswith(".gz"):
+            raise IndexException("Compressed capture %s can't be indexed, decompress it first" % self.capture_path)
+
+        stat = os.stat(self.capture_path)
+        entries = []
+        if stat.st_size:
+            with open(self.capture_path, "rb") as capture_file, \
+                    mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                entries = self._entries(data, stat.st_size)
+
+        if any(entries[index][2] > entries[index + 1][2] for index in range(len(entries) - 1)):
+            entries.sort(key=lambda entry: entry[2])
+
+        path = index_path(self.capture_path)
+        with open(path + ".tmp", "wb") as index_file:
+            index_file.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, len(entries)))
+            pack = ENTRY.pack
+            index_file.write(b"".join(pack(*entry) for entry in entries))
+        os.replace(path + ".tmp", path)
+        self.logger.info("[INDEX] Indexed %d records of %s" % (len(entries), self.capture_path))
+        return path
+
+    @staticmethod
+    def _entries(data, size):
+        # the regular expression skips payloads in C, Python only sees one match per record
+        entries = []
+        append, crc32, types, methods = entries.append, zlib.crc32, PAYLOAD_TYPES, METHOD_CODES
+        separator_size = len(SEPARATOR)
+
+        first = FIRST_RECORD.match(data)
+        start, fields = (0, first.groups()) if first else (None, None)
+        for match in NEXT_RECORD.finditer(data):
+            end = match.start()
+            if fields and fields[0] in types:
+                append((start, end - start, int(fields[1]), crc32(fields[3]) if fields[3] is not None else 0,
+                        types[fields[0]], methods.get(fields[2], 0)))
+            start, fields = end + separator_size, match.groups()
+        if fields and fields[0] in types:
+            append((start, size - start, int(fields[1]), crc32(fields[3]) if fields[3] is not None else 0,
+                    types[fields[0]], methods.get(fields[2], 0)))
+        return entries
+
+
+class Timestamps:
+    # sequence view of entry timestamps for bisect, every item is unpacked on access
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.count
+
+    def __getitem__(self, position):
+        return self.index.timestamp(position)
+
+
+class CaptureIndex:
+    """
+    Reads a capture file through its sidecar index: records of a time window are found by binary search
+    over the index, records of a path prefix are filtered by the hash of its first segment before
+    the capture file is touched. Both files are memory mapped, nothing is read in advance.
+    """
+
+    def __init__(self, capture_path):
+        self.capture_path = capture_path
+        self.path = index_path(capture_path)
+
+        with open(self.path, "rb") as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, mtime_ns, self.count = HEADER.unpack_from(self.index, 0)
+        if magic != MAGIC:
+            self.close()
+            raise IndexException("%s is not a capture index" % self.path)
+
+        stat = os.stat(capture_path)
+        if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            self.close()
+            raise IndexException("Index %s is stale, %s has changed" % (self.path, capture_path))
+
+        self.capture = None
+        if size:
+            with open(capture_path, "rb") as capture_file:
+                self.capture = mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, capture_path):
+        """
+        Opens the index of a capture file, (re)building it first when it is missing or stale.
+        """
+        try:
+            return cls(capture_path)
+        except (FileNotFoundError, IndexException):
+            CaptureIndexer(capture_path).build()
+            return cls(capture_path)
+
+    def close(self):
+        self.index.close()
+        if getattr(self, "capture", None):
+            self.capture.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, position) -> IndexEntry:
+        return IndexEntry(*ENTRY.unpack_from(self.index, HEADER.size + position * ENTRY.size))
+
+    def timestamp(self, position):
+        # timestamp follows the offset and the length
+        return struct.unpack_from("<q", self.index, HEADER.size + position * ENTRY.size + 12)[0]
+
+    def seek(self, timestamp):
+        """
+        Position of the first entry at or after timestamp (ns), O(log n).
+        """
+        return bisect.bisect_left(Timestamps(self), timestamp)
+
+    def entries(self, since=None, until=None):
+        """
+        Entries with since <= timestamp < until, timestamps in ns.
+        """
+        start = self.seek(since) if since is not None else 0
+        stop = self.seek(until) if until is not None else self.count
+        for position in range(start, stop):
+            yield self.entry(position)
+
+    def record(self, entry: IndexEntry) -> GorRecord:
+        return GorRecord.parse(self.capture[entry.offset:entry.offset + entry.length])
+
+    def records(self, since=None, until=None, path_prefix=None, payload_type=PayloadType.REQUEST):
+        """
+        Records of a time window (ns), of one payload type and optionally of requests whose path starts
+        with path_prefix.
+        """
+        wanted_type = PAYLOAD_TYPES.get(payload_type) if payload_type else None
+        wanted_hash = path_hash(path_prefix) if path_prefix else None
+        # a prefix ending inside the first segment ("/ap") can't be matched by its hash
+        whole_segment = path_prefix and (path_prefix.find("/", 1) != -1 or path_prefix.find("?", 1) != -1)
+        prefix = path_prefix.encode("latin-1") if path_prefix else None
+
+        for entry in self.entries(since, until):
+            if wanted_type and entry.type != wanted_type:
+                continue
+            if prefix:
+                if entry.type != 1 or (whole_segment and entry.path_hash != wanted_hash):
+                    continue
+                record = self.record(entry)
+                request_line = record.payload[:record.payload.find(b"\r\n")].split(b" ")
+                if len(request_line) != 3 or not request_line[1].startswith(prefix):
+                    continue
+                yield record
+            else:
+                yield self.record(entry)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Capture index',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--path', type=str, required=True,
+                        help='Capture file to index.')
+    parser.add_argument('--since', type=float, default=None,
+                        help='Unix timestamp of the first record to list.')
+    parser.add_argument('--until', type=float, default=None,
+                        help='Unix timestamp after the last record to list.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = get_args()
+
+    CaptureIndexer(args.path).build()
+    with CaptureIndex(args.path) as capture_index:
+        since = int(args.since * 1e9) if args.since is not None else None
+        until = int(args.until * 1e9) if args.until is not None else None
+        for index_entry in capture_index.entries(since, until):
+            print(json.dumps(index_entry.to_dict()))
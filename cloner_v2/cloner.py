@@ -4,12 +4,19 @@ import logging
 import os
 import signal
 import threading
+import time
 from logging import basicConfig
 from logging.config import dictConfig
 
 from command import Command
-from configuration import Configuration, ConfigurationReader
-from gor import GorArgs
+from configuration import Configuration, ConfigurationReader, ConfigurationWatcher, InputType
+from gor import GorCommand, GorCommandException
+from guardrail import Guardrail, GuardrailAction
+from metadata import BinaryMetadataCache
+from rate import RateController, scale_rates
+from shard import ShardedCloner, ShardStrategy
+from stats import GorStats
+from telemetry import ProcessTelemetry
 
 __version__ = "0.1"
 
@@ -17,11 +24,25 @@ __all__ = ["Cloner"]
 
 
 class Cloner:
-    def __init__(self, configuration: Configuration):
+    def __init__(self, configuration: Configuration, reload_overlap=2.0, gor_path="./gor", as_root=True,
+                 telemetry_interval=5.0, stop_timeout=5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
         self.cloner_thread = None
+        self.reload_overlap = reload_overlap
+        self.reload_lock = threading.Lock()
+        self.gor_path = gor_path
+        self.as_root = as_root
+        self.stop_timeout = stop_timeout
+        self.paused = False
+        self.stopping = False
+        # multiplies the rates of every output host, the guardrail throttles cloning with it
+        self.rate_factor = 1.0
 
-        gor_args = GorArgs(configuration).get()
-        self.gor_command = Command(gor_args)
+        self.configuration = configuration
+        self.gor_args = self._build(configuration)
+        self.gor_stats = GorStats()
+        self.gor_command = Command(self.gor_args, stop_timeout=stop_timeout, sinks=[self.gor_stats])
+        self.telemetry = ProcessTelemetry(lambda: self.gor_command.pid, interval=telemetry_interval)
 
         signal.signal(signal.SIGTERM, self.handler)
 
@@ -29,38 +50,165 @@ class Cloner:
         self.stop()
 
     def start(self):
-        self.cloner_thread = threading.Thread(
+        self.cloner_thread = self._start_thread(self.gor_command)
+        self.telemetry.start()
+
+    @staticmethod
+    def _start_thread(gor_command):
+        cloner_thread = threading.Thread(
             name="ClonerThread",
-            target=self.gor_command.execute,
+            target=gor_command.execute,
             daemon=True
         )
-        self.cloner_thread.start()
+        cloner_thread.start()
+        return cloner_thread
+
+    def reload(self, configuration: Configuration = None, rate_factor=None):
+        """
+        Replaces the running gor with one built from the new configuration (the current one when None) and
+        rate factor. The new gor is started first and both run for reload_overlap seconds, so no traffic is lost.
+        Nothing happens if gor arguments are the same. A paused cloner only keeps them for resume().
+        """
+        with self.reload_lock:
+            if self.stopping:
+                return False
+            configuration = configuration if configuration is not None else self.configuration
+            rate_factor = rate_factor if rate_factor is not None else self.rate_factor
+            gor_args = self._build(configuration, rate_factor)
+            if gor_args == self.gor_args:
+                self.configuration, self.rate_factor = configuration, rate_factor
+                self.logger.info("[RELOAD] Configuration changed, but gor arguments are the same - skipped")
+                return False
+
+            if self.paused:
+                self.configuration, self.rate_factor, self.gor_args = configuration, rate_factor, gor_args
+                self.logger.info("[RELOAD] Cloner is paused - configuration kept for resume")
+                return True
+
+            old_command, old_thread = self.gor_command, self.cloner_thread
+            new_command = Command(gor_args, stop_timeout=self.stop_timeout, sinks=[self.gor_stats],
+                                  handle_signals=False)
+
+            if self._shares_listen_port(configuration):
+                # only one gor can listen on the TCP port, the old one has to go first
+                self._stop_command(old_command, old_thread)
+                self.gor_command, self.cloner_thread = new_command, self._start_thread(new_command)
+            else:
+                new_thread = self._start_thread(new_command)
+                time.sleep(self.reload_overlap)
+                if not new_thread.is_alive() or new_command.return_code is not None:
+                    # e.g. a configuration gor rejects, the old gor keeps cloning
+                    new_command.request_stop()
+                    new_thread.join()
+                    self.logger.error("[RELOAD] New gor exited with %s, kept the running one - %s" % (
+                        new_command.return_code, new_command.stderr or "no output"))
+                    return False
+                self.gor_command, self.cloner_thread = new_command, new_thread
+                self._stop_command(old_command, old_thread)
+
+            self.configuration, self.rate_factor, self.gor_args = configuration, rate_factor, gor_args
+            self.logger.info("[RELOAD] Reloaded cloner - %s" % self.details())
+            return True
+
+    def throttle(self, rate_factor):
+        """
+        Reloads the current configuration with the rates of every output host multiplied by rate_factor,
+        1.0 restores configured rates. The factor stays applied to configurations reloaded later.
+        """
+        return self.reload(rate_factor=rate_factor)
+
+    def _build(self, configuration: Configuration, rate_factor=1.0):
+        if rate_factor != 1.0:
+            configuration = scale_rates(configuration, rate_factor)
+        return GorCommand(configuration, gor_path=self.gor_path, as_root=self.as_root).build()
+
+    def _shares_listen_port(self, configuration: Configuration):
+        return InputType.TCP in (self.configuration.input.type, configuration.input.type) \
+               and self.configuration.input.port == configuration.input.port
+
+    @staticmethod
+    def _stop_command(gor_command, cloner_thread):
+        # a gor which is still starting has no pid to signal yet
+        while cloner_thread and cloner_thread.is_alive() and not gor_command.started.wait(0.1):
+            pass
+        gor_command.terminate()
+        gor_command.request_stop()
+        if cloner_thread:
+            cloner_thread.join()
 
     def wait_for_thread(self):
-        print(self.cloner_thread.is_alive())
-        while self.cloner_thread.is_alive():
-            self.cloner_thread.join(timeout=1)
-            print(self.cloner_thread.is_alive())
-        print(self.cloner_thread.is_alive())
+        while True:
+            cloner_thread = self.cloner_thread
+            cloner_thread.join(timeout=1)
+            if cloner_thread.is_alive():
+                continue
+            # gor may have been replaced by reload in the meantime
+            with self.reload_lock:
+                if cloner_thread is self.cloner_thread and (self.stopping or not self.paused):
+                    return
+            if self.paused:
+                time.sleep(1)
+
+    def pause(self):
+        with self.reload_lock:
+            if self.paused or self.stopping:
+                return False
+            self.paused = True
+            self._stop_command(self.gor_command, self.cloner_thread)
+            self.logger.info("[PAUSE] Paused cloner - %s" % self.details())
+            return True
+
+    def resume(self):
+        with self.reload_lock:
+            if not self.paused or self.stopping:
+                return False
+            self.gor_command = Command(self.gor_args, stop_timeout=self.stop_timeout, sinks=[self.gor_stats],
+                                       handle_signals=False)
+            self.cloner_thread = self._start_thread(self.gor_command)
+            self.paused = False
+            self.logger.info("[RESUME] Resumed cloner - %s" % self.details())
+            return True
 
     def stop(self):
-        self.gor_command.terminate()
+        self.stopping = True
+        self.telemetry.stop()
+        with self.reload_lock:
+            self.gor_command.terminate()
+            self.gor_command.request_stop()
         self.wait_for_thread()
 
     def force_stop(self):
         os.kill(self.gor_command.pid, signal.SIGKILL)
 
+    def resources(self):
+        return self.telemetry.samples()
+
+    def resources_json(self):
+        return self.telemetry.to_json()
+
+    def statistics(self):
+        return self.gor_stats.snapshot()
+
     def details(self):
         if self.gor_command:
             return " ".join(self.gor_command.command)
         return None
 
     @staticmethod
-    def version():
-        gor_args = GorArgs(None, as_root=False).get()
-        result = Command(gor_args).execute()
-        version = result.stdout
-        return version
+    def version(gor_path="./gor"):
+        try:
+            return gor_metadata.get(gor_path).version
+        except OSError as e:
+            raise GorCommandException("Not found 'gor' application in path: %s - %s" % (gor_path, e))
+
+
+def probe_gor_version(gor_path):
+    gor_args = GorCommand(None, gor_path=gor_path, as_root=False).build()
+    result = Command(gor_args, handle_signals=False).execute()
+    return result.stdout, result.return_code
+
+
+gor_metadata = BinaryMetadataCache(probe_gor_version)
 
 
 def get_args():
@@ -71,7 +219,34 @@ def get_args():
     parser.add_argument('--configuration-path', type=str,
                         required=False,
                         help='Path to configuration.')
-    return parser.parse_args()
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Number of gor processes sharing one configuration.')
+    parser.add_argument('--shard-by', type=str, default=ShardStrategy.OUTPUT,
+                        choices=[ShardStrategy.OUTPUT, ShardStrategy.PATHS],
+                        help='How a configuration is split between shards.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Reload configuration when the file changes.')
+    parser.add_argument('--watch-interval', type=float, default=1.0,
+                        help='Seconds between checks of the configuration file.')
+    parser.add_argument('--reload-overlap', type=float, default=2.0,
+                        help='Seconds both old and new gor run during reload.')
+    parser.add_argument('--adaptive-rate', action='store_true',
+                        help='Adjust output rates to latency and errors of output hosts.')
+    parser.add_argument('--adaptive-rate-min', type=float, default=0.01,
+                        help='Lowest rate --adaptive-rate sets, as a fraction of the configured rate of a host.')
+    parser.add_argument('--adaptive-rate-max', type=float, default=1.0,
+                        help='Highest rate --adaptive-rate sets, as a fraction of the configured rate of a host. '
+                             'Percent rates never exceed 100%%.')
+    parser.add_argument('--guardrail', type=str, default=None,
+                        choices=[GuardrailAction.THROTTLE, GuardrailAction.PAUSE],
+                        help='Throttle or pause cloning while the host is busy.')
+    args = parser.parse_args()
+    if args.shards > 1:
+        # reload, rate adjustment and throttling work on a single gor only
+        for name in ('watch', 'adaptive_rate', 'guardrail'):
+            if getattr(args, name):
+                parser.error("--%s is not supported with --shards > 1" % name.replace('_', '-'))
+    return args
 
 
 def setup_logging(
@@ -115,12 +290,33 @@ if __name__ == '__main__':
         raise Exception("--configuration-path argument is required !")
 
     cloner = None
+    watcher = None
+    rate_controller = None
+    guardrail = None
     try:
         configuration = ConfigurationReader.read(args.configuration_path)
 
-        cloner = Cloner(configuration)
+        if args.shards > 1:
+            cloner = ShardedCloner(configuration, args.shards, args.shard_by)
+        else:
+            cloner = Cloner(configuration, reload_overlap=args.reload_overlap)
         logging.info("[START] Started cloner - %s" % cloner.details())
         cloner.start()
+
+        if args.adaptive_rate:
+            rate_controller = RateController(cloner, min_ratio=args.adaptive_rate_min,
+                                             max_ratio=args.adaptive_rate_max)
+            rate_controller.start()
+
+        if args.watch:
+            # adjusted rates have to be rebuilt for a new configuration before the cloner gets it
+            callback = rate_controller.reload if rate_controller else cloner.reload
+            watcher = ConfigurationWatcher(args.configuration_path, callback, args.watch_interval)
+            watcher.start()
+
+        if args.guardrail:
+            guardrail = Guardrail(cloner, action=args.guardrail)
+            guardrail.start()
         cloner.wait_for_thread()
     except SystemExit:
         logging.error('System exit', exc_info=True)
@@ -132,4 +328,10 @@ if __name__ == '__main__':
         logging.error('Error', exc_info=True)
         raise
     finally:
+        if guardrail:
+            guardrail.stop()
+        if rate_controller:
+            rate_controller.stop()
+        if watcher:
+            watcher.stop()
         stop(cloner)
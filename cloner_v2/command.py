@@ -1,32 +1,113 @@
 import logging
 import os
+import selectors
 import signal
+import threading
 import time
 from subprocess import Popen, PIPE, TimeoutExpired, CalledProcessError
 
+from output import RingBuffer, StreamDrainer
+from termination import Terminator
+
 __version__ = "0.1"
 
-__all__ = ["Command"]
+__all__ = ["Command", "ExitWaiter"]
+
+
+class ExitWaiter:
+    """
+    Blocks until a child process exits or a stop is requested.
+
+    On Linux >= 5.3 the child is watched through a pidfd, otherwise a helper thread blocks in wait().
+    Both paths wake a selector, so the waiting thread sleeps until something actually happens.
+    """
+
+    def __init__(self, proc):
+        self.proc = proc
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self._pidfd = self._open_pidfd(proc.pid)
+        if self._pidfd is not None:
+            self._selector.register(self._pidfd, selectors.EVENT_READ)
+        else:
+            threading.Thread(
+                name="ExitWaiterThread-%s" % proc.pid,
+                target=self._wait_in_thread,
+                daemon=True
+            ).start()
+
+    @staticmethod
+    def _open_pidfd(pid):
+        if not hasattr(os, "pidfd_open"):
+            return None
+        try:
+            return os.pidfd_open(pid)
+        except OSError:
+            return None
+
+    def _wait_in_thread(self):
+        self.proc.wait()
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except OSError:
+            pass
+
+    def wait(self, timeout=None):
+        """
+        Returns the return code if the process has exited, otherwise None (stop requested or timeout).
+        """
+        if self.proc.poll() is not None:
+            return self.proc.returncode
+        for key, _ in self._selector.select(timeout):
+            if key.fd == self._wakeup_read:
+                os.read(self._wakeup_read, 512)
+        return self.proc.poll()
+
+    def close(self):
+        self._selector.close()
+        for fd in (self._pidfd, self._wakeup_read, self._wakeup_write):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
 
 
 class Command:
     pid = -1
     return_code = None
-    stdout = None
-    stderr = None
     stop = False
-    retry_attempt = 0
+    stop_requested_at = None
+    exit_latency = None
+    termination = None
 
-    def __init__(self, command, timeout=None, shell=False):
+    def __init__(self, command, timeout=None, shell=False, stop_timeout=5.0, kill_timeout=2.0, buffer_size=64 * 1024,
+                 sinks=None, handle_signals=True):
         self.logger = logging.getLogger(self.__class__.__name__)
 
         self.command = command
         self.timeout = timeout
         self.shell = shell
+        self.stop_timeout = stop_timeout
+        self.kill_timeout = kill_timeout
+        self.terminator = Terminator(term_timeout=stop_timeout, kill_timeout=kill_timeout)
+        self.sinks = sinks or []
 
         self.proc = None
+        self.started = threading.Event()
+        self.exited = threading.Event()
+        self.waiter = None
+        self.drainer = None
+        self.stdout_buffer = RingBuffer(buffer_size)
+        self.stderr_buffer = RingBuffer(buffer_size)
 
-        signal.signal(signal.SIGTERM, self.handler)
+        if handle_signals:
+            # signal handlers can be installed only from the main thread
+            signal.signal(signal.SIGTERM, self.handler)
 
     def __str__(self):
         return "Command(" \
@@ -42,22 +123,50 @@ class Command:
                    self.stderr
                )
 
+    @property
+    def stdout(self):
+        return self._decode(self.stdout_buffer)
+
+    @property
+    def stderr(self):
+        return self._decode(self.stderr_buffer)
+
+    @staticmethod
+    def _decode(buffer):
+        if len(buffer) == 0:
+            return None
+        return buffer.getvalue().decode('utf-8', errors='replace').strip()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
     def execute(self):
         try:
-            with Popen(self.command, stdout=PIPE, stderr=PIPE, shell=self.shell) as self.proc:
+            # own process group, so the whole tree (sudo and gor) can be signalled at once. Not a `with` block,
+            # Popen.__exit__ waits for the process without a deadline
+            self.proc = Popen(self.command, stdout=PIPE, stderr=PIPE, shell=self.shell, start_new_session=True)
+            try:
                 self.pid = self._pid()
+                self.drainer = StreamDrainer(self.pid, self.sinks) \
+                    .add("stdout", self.proc.stdout, self.stdout_buffer) \
+                    .add("stderr", self.proc.stderr, self.stderr_buffer) \
+                    .start()
+                self.waiter = ExitWaiter(self.proc)
+                self.started.set()
                 self.logger.error("[%s] Started command - %s" % (self.pid, self.command))
-                while True:
-                    if self.proc.poll() is not None or self.stop:
-                        break
-                    else:
-                        time.sleep(0.1)
+                try:
+                    self._wait_for_exit()
+                finally:
+                    self.waiter.close()
 
                 self.return_code = self.proc.returncode
-                self.stdout = self.proc.stdout.read().decode('utf-8').strip()
-                self.stderr = self.proc.stderr.read().decode('utf-8').strip()
+                self._record_exit_latency()
+                self._stop_drainer()
 
                 return self
+            finally:
+                self.proc.stdout.close()
+                self.proc.stderr.close()
         except TimeoutExpired as e:
             raise e
         except CalledProcessError as e:
@@ -65,61 +174,91 @@ class Command:
         except Exception as e:
             raise e
 
+    def _wait_for_exit(self):
+        # a stop request only wakes the waiter up, the process gets the termination deadlines to actually exit
+        deadline = None
+        while self.waiter.wait(self._remaining(deadline)) is None:
+            if self.stop:
+                if deadline is None:
+                    deadline = time.monotonic() + self.stop_timeout + self.kill_timeout
+                elif time.monotonic() >= deadline:
+                    # not stopped by terminate() in time, kill the group and give up on it if even that fails
+                    self.termination = self.terminator.kill(self.proc.pid, self._wait_until_exited)
+                    if not self.termination.success:
+                        self.logger.error("[%s] Not reaped %.1fs after stop request, left behind - %s" % (
+                            self.pid, time.monotonic() - self.stop_requested_at, self.command))
+                    break
+        if self.proc.poll() is not None:
+            self.exited.set()
+
+    def _wait_until_exited(self, timeout):
+        # polls the process, so it works on the thread running execute() too (the SIGTERM handler)
+        deadline = time.monotonic() + timeout
+        while not self.exited.is_set():
+            if self.proc.poll() is not None:
+                self.exited.set()
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.exited.wait(min(remaining, 0.05))
+        return True
+
+    @staticmethod
+    def _remaining(deadline):
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    def _stop_drainer(self):
+        # children of the process (e.g. gor under sudo) can keep the pipes open after it has exited
+        self.drainer.join(self.stop_timeout)
+        if self.drainer.is_alive():
+            self.drainer.stop()
+            self.drainer.join()
+        self.drainer.close()
+
+    def _record_exit_latency(self):
+        if self.stop_requested_at is not None and self.return_code is not None:
+            self.exit_latency = time.monotonic() - self.stop_requested_at
+            self.logger.info("[%s] Exited with %s in %.3f ms after stop request" % (
+                self.pid, self.return_code, self.exit_latency * 1000))
+
+    def request_stop(self):
+        if self.stop_requested_at is None:
+            self.stop_requested_at = time.monotonic()
+        self.stop = True
+        if self.waiter:
+            self.waiter.wakeup()
+
     def _pid(self):
         if self.proc:
             return self.proc.pid
         return -1
 
     def terminate(self):
-        try:
-            if self.proc:
-                self.proc.terminate()
-        except PermissionError:
-            if self._log():
-                self.logger.error("[%s] Terminate operation is not permitted - %s." % (self.pid, self.command), exc_info=False)
-            try:
-                if self.proc:
-                    self.proc.kill()
-            except PermissionError:
-                if self._log():
-                    self.logger.error("[%s] Kill operation is not permitted - %s." % (self.pid, self.command), exc_info=False)
-                self._terminate_as_root()
-        except ProcessLookupError:
-            self.logger.error("[%s] Not found an open process which executes - %s." % (self.pid, self.command), exc_info=False)
-            pass
-
-    def _terminate_as_root(self):
-        try:
-            sudo_kill = "sudo kill %s" % self.pid
-            result = os.system(sudo_kill)
-            if self._log():
-                self.logger.error("[%s] Executed command %s returns %s" % (self.retry_attempt, sudo_kill, result))
-            self._wait_for_stop()
-
-            if self.retry_attempt >= 600:
-                raise Exception("Stopping is taking too much time")
+        """
+        Stops the process group of the command within stop_timeout + kill_timeout seconds.
+        """
+        if self.stop_requested_at is None:
+            self.stop_requested_at = time.monotonic()
+        if not self.proc or self.exited.is_set():
+            return self.termination
 
-            os.killpg(os.getpgid(self.pid), signal.SIGTERM)
-        except Exception as e:
-            self.logger.error("[%s][STACKED] Couldn't kill an open process as a root - %s" % (self.pid, e))
-
-    def _wait_for_stop(self):
-        if self.proc:
-            for i in range(10):
-                if self.proc.poll() is not None:
-                    exit(self.proc.poll())
-                # self.logger.error("[%d] Still working: %s" % (i, self.proc.poll()))
-                time.sleep(0.01)
+        self.termination = self.terminator.terminate(self.proc.pid, self._wait_until_exited)
+        if self.termination.success:
+            self.logger.info("[%s] Stopped in %.3f ms by %s" % (
+                self.pid, self.termination.elapsed * 1000, self.termination.stage))
+        else:
+            self.logger.error("[%s] Couldn't stop in %.3f ms - %s" % (
+                self.pid, self.termination.elapsed * 1000, self.command))
+        return self.termination
 
     def handler(self, signum, frame):
-        self.retry_attempt += 1
-        if self._log():
-            self.logger.error("[%s] Handle signal - %s (SIGTERM=15)" % (self.pid, signum))
+        self.logger.error("[%s] Handle signal - %s (SIGTERM=15)" % (self.pid, signum))
+        self.request_stop()
         self.terminate()
-        self.stop = True
 
-    def _log(self):
-        return self.retry_attempt == 1 or self.retry_attempt % 30 == 0
 
 if __name__ == '__main__':
     c = None
@@ -1,27 +1,65 @@
+import copy
+import hashlib
 import json
+import logging
+import os
+import threading
 
 __version__ = "0.1"
 
-__all__ = ["Configuration", "ConfigurationReader"]
+__all__ = ["Configuration", "ConfigurationReader", "ConfigurationWatcher", "InputFile", "OutputFile"]
+
+
+NoneType = type(None)
 
 
 class JsonMapper:
     def to_json(self):
-        return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True, indent=4)
+        return json.dumps(self, default=lambda o: o.to_dict(), sort_keys=True, indent=4)
 
     @classmethod
     def from_json(cls, json_str):
         json_dict = json.loads(json_str)
-        return cls(**json_dict)
+        if type(json_dict) is not dict:
+            raise TypeError("%s has to be a JSON object, got %s" % (cls.__name__, type(json_dict).__name__))
+        return cls.from_dict(json_dict)
 
 
 class Dict2Object:
+    """
+    Base of configuration objects. Attributes live in __slots__ and `schema` maps every field to its allowed
+    types, which are checked while loading, before an object is built.
+    """
+    __slots__ = ()
+    schema = {}
+
     @classmethod
     def from_dict(cls, dictionary):
         if type(dictionary) is dict:
+            cls.check_types(dictionary)
             return cls(**dictionary)
         return dictionary
 
+    @classmethod
+    def check_types(cls, dictionary):
+        for name, value in dictionary.items():
+            types = cls.schema.get(name)
+            if types is None:
+                raise TypeError("%s got an unexpected field '%s'" % (cls.__name__, name))
+            # bool is an int, but true is never a correct port or number of workers
+            if not isinstance(value, types) or (type(value) is bool and bool not in types):
+                raise TypeError("%s.%s has to be %s, got %s" % (
+                    cls.__name__, name, " or ".join(t.__name__ for t in types), type(value).__name__))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    # equal by value and mutable, so not hashable
+    __hash__ = None
+
 
 class Paths(Dict2Object):
     """
@@ -31,6 +69,12 @@ class Paths(Dict2Object):
         "rewrite": []
     }
     """
+    __slots__ = ("allow", "disallow", "rewrite")
+    schema = {
+        "allow": (list,),
+        "disallow": (list,),
+        "rewrite": (list,)
+    }
 
     def __init__(self, allow, disallow, rewrite):
         self.rewrite = rewrite
@@ -41,6 +85,28 @@ class Paths(Dict2Object):
 class InputType:
     RAW = "raw"
     TCP = "tcp"
+    FILE = "file"
+
+
+class InputFile(Dict2Object):
+    """
+    "file": {
+        "path": "/var/lib/cloner/requests_*.gor",
+        "speed": "200%",
+        "loop": false
+    }
+    """
+    __slots__ = ("path", "speed", "loop")
+    schema = {
+        "path": (str,),
+        "speed": (str, NoneType),
+        "loop": (bool,)
+    }
+
+    def __init__(self, path, speed=None, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
 
 
 class Input(Dict2Object):
@@ -52,14 +118,23 @@ class Input(Dict2Object):
             "allow": [],
             "disallow": [],
             "rewrite": []
-        }
+        },
+        "file": null
      },
     """
+    __slots__ = ("type", "port", "paths", "file")
+    schema = {
+        "type": (str,),
+        "port": (int,),
+        "paths": (dict, Paths, NoneType),
+        "file": (dict, InputFile, NoneType)
+    }
 
-    def __init__(self, type: InputType, port, paths: Paths):
+    def __init__(self, type: InputType, port=0, paths: Paths = None, file: InputFile = None):
         self.type = type
         self.port = port
         self.paths = Paths.from_dict(paths)
+        self.file = InputFile.from_dict(file)
 
 
 class Http(Dict2Object):
@@ -71,14 +146,23 @@ class Http(Dict2Object):
             "http://c"
         ],
         "rate": "100%",
-        "workers": -1
+        "workers": -1,
+        "stats": false
     },
     """
+    __slots__ = ("hosts", "rate", "workers", "stats")
+    schema = {
+        "hosts": (list,),
+        "rate": (str, NoneType),
+        "workers": (int,),
+        "stats": (bool,)
+    }
 
-    def __init__(self, hosts: list, rate=None, workers=-1):
+    def __init__(self, hosts: list, rate=None, workers=-1, stats=False):
         self.hosts = hosts
         self.rate = rate
         self.workers = workers
+        self.stats = stats
 
 
 class Tcp(Dict2Object):
@@ -92,12 +176,44 @@ class Tcp(Dict2Object):
         "rate": "100%",
     },
     """
+    __slots__ = ("hosts", "rate")
+    schema = {
+        "hosts": (list,),
+        "rate": (str, NoneType)
+    }
 
     def __init__(self, hosts: list, rate=None):
         self.hosts = hosts
         self.rate = rate
 
 
+class OutputFile(Dict2Object):
+    """
+    "file": {
+        "path": "/var/lib/cloner/requests_%Y%m%d%H.gor",
+        "size_limit": "256mb",
+        "compress": true,
+        "append": false,
+        "flush_interval": "1s"
+    }
+    """
+    __slots__ = ("path", "size_limit", "compress", "append", "flush_interval")
+    schema = {
+        "path": (str,),
+        "size_limit": (str, NoneType),
+        "compress": (bool,),
+        "append": (bool,),
+        "flush_interval": (str, NoneType)
+    }
+
+    def __init__(self, path, size_limit=None, compress=False, append=False, flush_interval=None):
+        self.path = path
+        self.size_limit = size_limit
+        self.compress = compress
+        self.append = append
+        self.flush_interval = flush_interval
+
+
 class Output(Dict2Object):
     """
     "output": {
@@ -111,18 +227,42 @@ class Output(Dict2Object):
             "split_traffic": false,
             "workers": -1
         },
-        "stdout": false
+        "stdout": false,
+        "file": null,
+        "split_key": "cookie:session"
     },
+
+    split_key keeps requests with the same cookie, header or path segment on one HTTP host (replay.py only).
     """
+    __slots__ = ("http", "tcp", "split_traffic", "stdout", "file", "split_key")
+    schema = {
+        "http": (dict, Http, NoneType),
+        "tcp": (dict, Tcp, NoneType),
+        "split_traffic": (bool,),
+        "stdout": (bool,),
+        "file": (dict, OutputFile, NoneType),
+        "split_key": (str, NoneType)
+    }
 
-    def __init__(self, http: Http, tcp: Tcp, split_traffic=False, stdout=False):
+    def __init__(self, http: Http = None, tcp: Tcp = None, split_traffic=False, stdout=False,
+                 file: OutputFile = None, split_key=None):
         self.http = Http.from_dict(http)
         self.tcp = Tcp.from_dict(tcp)
         self.split_traffic = split_traffic
         self.stdout = stdout
+        self.file = OutputFile.from_dict(file)
+        self.split_key = split_key
+
 
+class Configuration(JsonMapper, Dict2Object):
+    __slots__ = ("input", "output", "finish_after", "extra_args")
+    schema = {
+        "input": (dict, Input),
+        "output": (dict, Output),
+        "finish_after": (str, NoneType),
+        "extra_args": (dict, NoneType)
+    }
 
-class Configuration(JsonMapper):
     def __init__(self, input: Input, output: Output, finish_after=None, extra_args=None):
         self.extra_args = extra_args
         self.finish_after = finish_after
@@ -130,15 +270,114 @@ class Configuration(JsonMapper):
         self.input = Input.from_dict(input)
 
 
+class CacheEntry:
+    __slots__ = ("mtime_ns", "size", "digest", "configuration")
+
+    def __init__(self, mtime_ns, size, digest, configuration):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.configuration = configuration
+
+
 class ConfigurationReader:
+    """
+    Parsed configurations are cached per file. A file is not read again while its mtime and size stay the same,
+    and not parsed again while its content hash stays the same. Every caller gets its own copy of the cached
+    configuration, so changing it doesn't change what other callers read.
+    """
+    cache = {}
+    cache_lock = threading.Lock()
+
     @staticmethod
-    def read(path) -> Configuration:
+    def read(path, use_cache=True) -> Configuration:
         try:
-            with open(path) as configuration_file:
-                return Configuration.from_json(configuration_file.read())
+            stat = os.stat(path)
+            key = os.path.realpath(path)
+            with ConfigurationReader.cache_lock:
+                entry = ConfigurationReader.cache.get(key) if use_cache else None
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                return copy.deepcopy(entry.configuration)
+
+            with open(path, "rb") as configuration_file:
+                content = configuration_file.read()
+            digest = hashlib.sha1(content).hexdigest()
+            if entry and entry.digest == digest:
+                configuration = entry.configuration
+            else:
+                configuration = Configuration.from_json(content.decode("utf-8"))
+
+            with ConfigurationReader.cache_lock:
+                ConfigurationReader.cache[key] = CacheEntry(stat.st_mtime_ns, len(content), digest, configuration)
+            return copy.deepcopy(configuration)
         except FileNotFoundError as e:
             raise Exception("Couldn't open file (%s): %s." % (path, e))
         except ValueError as e:
             raise Exception("Configuration file (%s) has incorrect format: %s." % (path, e))
         except TypeError as e:
             raise Exception("Couldn't parse configuration file (%s): %s." % (path, e))
+
+    @staticmethod
+    def clear_cache():
+        with ConfigurationReader.cache_lock:
+            ConfigurationReader.cache.clear()
+
+
+class ConfigurationWatcher:
+    """
+    Watches mtime and size of a configuration file and passes every changed, correctly parsed configuration
+    to the callback. A configuration which can't be read is logged and ignored.
+    """
+
+    def __init__(self, path, callback, interval=1.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+
+        self.stopping = threading.Event()
+        self.thread = None
+        self.signature = self._signature()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino
+        except OSError:
+            return None
+
+    def start(self):
+        self.thread = threading.Thread(
+            name="ConfigurationWatcherThread",
+            target=self._watch,
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def _watch(self):
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+    def check(self):
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+
+        try:
+            configuration = ConfigurationReader.read(self.path)
+        except Exception as e:
+            self.logger.error("Ignored changed configuration %s - %s" % (self.path, e))
+            return False
+
+        try:
+            self.callback(configuration)
+        except Exception as e:
+            self.logger.error("Couldn't apply changed configuration %s - %s" % (self.path, e))
+        return True
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the gor binary used by benchmark.py. Behaviour is configured through environment variables:
+
+    FAKE_GOR_EXIT_DELAY      seconds to keep running after SIGTERM (default 0)
+    FAKE_GOR_IGNORE_SIGTERM  "1" ignores SIGTERM, only SIGKILL stops the process
+    FAKE_GOR_FLOOD           "1" writes to stdout as fast as possible
+    FAKE_GOR_RUN_FOR         seconds to run before exiting on its own (default: forever)
+
+Without arguments it prints a version line, like gor does.
+"""
+import os
+import signal
+import sys
+import time
+
+__version__ = "0.1"
+
+
+def main():
+    if len(sys.argv) == 1:
+        print("Version: 0.0.0-fake")
+        return 0
+
+    exit_delay = float(os.environ.get("FAKE_GOR_EXIT_DELAY", "0"))
+    run_for = float(os.environ.get("FAKE_GOR_RUN_FOR", "0"))
+
+    def terminate(signum, frame):
+        if exit_delay:
+            time.sleep(exit_delay)
+        os._exit(0)
+
+    if os.environ.get("FAKE_GOR_IGNORE_SIGTERM") == "1":
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    else:
+        signal.signal(signal.SIGTERM, terminate)
+
+    deadline = time.monotonic() + run_for if run_for else None
+    if os.environ.get("FAKE_GOR_FLOOD") == "1":
+        line = ("GET /flood HTTP/1.1 " * 4 + "\n").encode("utf-8") * 64
+        out = sys.stdout.buffer
+        while deadline is None or time.monotonic() < deadline:
+            out.write(line)
+    else:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(3600 if deadline is None else max(0.0, deadline - time.monotonic()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
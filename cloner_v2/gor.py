@@ -1,10 +1,11 @@
 import os
 
+from capture import output_file_path
 from configuration import Configuration
 from configuration import ConfigurationReader
 from configuration import InputType
 
-from validator import Validator
+from validator import Validator, ConfigurationValidator
 
 __version__ = "0.1"
 
@@ -17,7 +18,9 @@ def flat_array(array: list):
 
 
 class GorCommandException(Exception):
-    pass
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or [message]
 
 
 class GorCommand:
@@ -40,6 +43,21 @@ class GorCommand:
             raise GorCommandException("RAW port %s has to be greater than 0" % self.configuration.input.port)
         return []
 
+    def _input_file(self):
+        if InputType.FILE == self.configuration.input.type:
+            input_file = self.configuration.input.file
+            if not input_file or not input_file.path:
+                raise GorCommandException("FILE input requires a file path")
+            if input_file.speed:
+                return ["--input-file", '"%s|%s"' % (input_file.path, input_file.speed)]
+            return ["--input-file", '"%s"' % input_file.path]
+        return []
+
+    def _input_file_loop(self):
+        if InputType.FILE == self.configuration.input.type and self.configuration.input.file.loop:
+            return ["--input-file-loop"]
+        return []
+
     def _append_rate(self, host, global_rate):
         if host.get("rate", None):
             return '"%s|%s"' % (host["host"], host["rate"])
@@ -89,6 +107,21 @@ class GorCommand:
             output_https += self._output_http(target_host)
         return output_https
 
+    def _output_file(self):
+        output_file = self.configuration.output.file
+        if not output_file:
+            return []
+
+        # gor rotates by time through strftime patterns in the path and gzips files ending with .gz
+        args = ["--output-file", '"%s"' % output_file_path(output_file)]
+        if output_file.size_limit:
+            args += ["--output-file-size-limit", output_file.size_limit]
+        if output_file.append:
+            args += ["--output-file-append"]
+        if output_file.flush_interval:
+            args += ["--output-file-flush-interval", output_file.flush_interval]
+        return args
+
     def _output_stdout(self):
         if self.configuration.output.stdout:
             return ["--output-stdout", "true"]
@@ -142,10 +175,17 @@ class GorCommand:
 
     def _output_http_workers(self):
         # (Average number of requests per second)/(Average target response time per second)
-        if self.configuration.output.http.workers >= 1:
+        if self.configuration.output.http and self.configuration.output.http.workers >= 1:
             return ["--output-http-workers", str(self.configuration.output.http.workers)]
         return []
 
+    def _output_http_stats(self):
+        # periodic queue stats on stdout, parsed by stats.GorStats. A boolean flag takes no value, Go's flag
+        # parsing stops at the first argument which isn't a flag and would ignore every flag after it
+        if self.configuration.output.http and self.configuration.output.http.stats:
+            return ["--output-http-stats"]
+        return []
+
     def _extra_args(self):
         if self.configuration.extra_args:
             extra_args = [[key, '"%s"' % value] for key, value in self.configuration.extra_args.items()]
@@ -157,7 +197,18 @@ class GorCommand:
             return [self.gor_path]
         raise GorCommandException("Not found 'gor' application in path: %s" % self.gor_path)
 
+    def validate(self):
+        errors = ConfigurationValidator().validate(self.configuration)
+        if self.configuration and self.configuration.output.split_key:
+            errors.append("Output split_key %s is supported by replay.py only, gor splits traffic round-robin"
+                          % self.configuration.output.split_key)
+        if errors:
+            raise GorCommandException("Configuration has %d error(s): %s" % (len(errors), "; ".join(errors)), errors)
+
     def build(self):
+        # reports every error at once, then building reuses the memoized validation results
+        self.validate()
+
         args = []
 
         if self.as_root:
@@ -168,6 +219,8 @@ class GorCommand:
         if self.configuration:
             args += self._input_raw()
             args += self._input_tcp()
+            args += self._input_file()
+            args += self._input_file_loop()
 
             args += self._http_allow_urls()
             args += self._http_disallow_urls()
@@ -175,7 +228,9 @@ class GorCommand:
 
             args += self._output_https()
             args += self._output_http_workers()
+            args += self._output_http_stats()
             args += self._output_tcps()
+            args += self._output_file()
 
             args += self._split_output()
             args += self._output_stdout()
@@ -0,0 +1,203 @@
+import datetime
+import logging
+import os
+import threading
+from collections import deque
+
+__version__ = "0.1"
+
+__all__ = ["HostLoad", "HostLoadReader", "Guardrail", "GuardrailAction"]
+
+
+class HostLoad:
+    def __init__(self, load_per_cpu=0.0, cpu_percent=None, memory_pressure=None, memory_available_percent=None):
+        # 1 minute load average divided by the number of CPUs
+        self.load_per_cpu = load_per_cpu
+        # CPU utilisation since the previous reading
+        self.cpu_percent = cpu_percent
+        # PSI "some avg10" of memory, None without PSI
+        self.memory_pressure = memory_pressure
+        self.memory_available_percent = memory_available_percent
+
+    def to_dict(self):
+        return {
+            "load_per_cpu": self.load_per_cpu,
+            "cpu_percent": self.cpu_percent,
+            "memory_pressure": self.memory_pressure,
+            "memory_available_percent": self.memory_available_percent
+        }
+
+
+class HostLoadReader:
+    def __init__(self, proc="/proc"):
+        self.proc = proc
+        self.cpus = os.cpu_count() or 1
+        self.previous_cpu = None
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.proc, name)) as proc_file:
+                return proc_file.read()
+        except OSError:
+            return None
+
+    def read(self) -> HostLoad:
+        return HostLoad(self._load_per_cpu(), self._cpu_percent(), self._memory_pressure(),
+                        self._memory_available_percent())
+
+    def _load_per_cpu(self):
+        loadavg = self._read("loadavg")
+        return float(loadavg.split()[0]) / self.cpus if loadavg else 0.0
+
+    def _cpu_percent(self):
+        stat = self._read("stat")
+        if not stat:
+            return None
+        # cpu user nice system idle iowait irq softirq steal ...
+        times = [int(value) for value in stat.splitlines()[0].split()[1:9]]
+        total, idle = sum(times), times[3] + times[4]
+
+        previous, self.previous_cpu = self.previous_cpu, (total, idle)
+        if previous is None or total == previous[0]:
+            return None
+        return 100.0 * (1 - (idle - previous[1]) / (total - previous[0]))
+
+    def _memory_pressure(self):
+        pressure = self._read("pressure/memory")
+        if not pressure:
+            return None
+        for line in pressure.splitlines():
+            if line.startswith("some"):
+                return float(dict(field.split("=") for field in line.split()[1:])["avg10"])
+        return None
+
+    def _memory_available_percent(self):
+        meminfo = self._read("meminfo")
+        if not meminfo:
+            return None
+        values = {}
+        for line in meminfo.splitlines():
+            name, _, value = line.partition(":")
+            values[name] = int(value.split()[0])
+        if not values.get("MemTotal") or "MemAvailable" not in values:
+            return None
+        return 100.0 * values["MemAvailable"] / values["MemTotal"]
+
+
+class GuardrailAction:
+    THROTTLE = "throttle"
+    PAUSE = "pause"
+    RESUME = "resume"
+
+
+class Guardrail:
+    """
+    Backs off cloning while the production host is busy. After `trigger_checks` readings in a row above
+    any threshold the gor rates are multiplied by throttle_factor (or gor is paused), and after `recover_checks`
+    readings in a row below resume_ratio of every threshold the rates of the current configuration are restored.
+    Configurations reloaded meanwhile (by the watcher or the RateController) stay throttled until then.
+    Every intervention is logged and kept with its timestamp and the readings which caused it.
+    """
+
+    def __init__(self, cloner, action=GuardrailAction.THROTTLE, interval=5.0, max_load_per_cpu=1.0,
+                 max_cpu_percent=85.0, max_memory_pressure=10.0, min_memory_available_percent=10.0,
+                 throttle_factor=0.25, trigger_checks=2, recover_checks=6, resume_ratio=0.8,
+                 reader: HostLoadReader = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.cloner = cloner
+        self.action = action
+        self.interval = interval
+        self.max_load_per_cpu = max_load_per_cpu
+        self.max_cpu_percent = max_cpu_percent
+        self.max_memory_pressure = max_memory_pressure
+        self.min_memory_available_percent = min_memory_available_percent
+        self.throttle_factor = throttle_factor
+        self.trigger_checks = trigger_checks
+        self.recover_checks = recover_checks
+        self.resume_ratio = resume_ratio
+        self.reader = reader or HostLoadReader()
+
+        self.engaged = None
+        self.over = 0
+        self.under = 0
+        self.interventions = deque(maxlen=1000)
+
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopping.clear()
+        self.reader.read()
+        self.thread = threading.Thread(
+            name="GuardrailThread",
+            target=self._run,
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error("Couldn't check host load - %s" % e)
+
+    def exceeded(self, load: HostLoad, ratio=1.0):
+        reasons = []
+        if load.load_per_cpu > self.max_load_per_cpu * ratio:
+            reasons.append("load per CPU %.2f" % load.load_per_cpu)
+        if load.cpu_percent is not None and load.cpu_percent > self.max_cpu_percent * ratio:
+            reasons.append("CPU %.1f%%" % load.cpu_percent)
+        if load.memory_pressure is not None and load.memory_pressure > self.max_memory_pressure * ratio:
+            reasons.append("memory pressure %.1f%%" % load.memory_pressure)
+        if load.memory_available_percent is not None \
+                and load.memory_available_percent < self.min_memory_available_percent / ratio:
+            reasons.append("memory available %.1f%%" % load.memory_available_percent)
+        return reasons
+
+    def check(self):
+        load = self.reader.read()
+        if self.engaged is None:
+            reasons = self.exceeded(load)
+            self.over = self.over + 1 if reasons else 0
+            if self.over >= self.trigger_checks:
+                self._engage(load, reasons)
+        else:
+            reasons = self.exceeded(load, self.resume_ratio)
+            self.under = 0 if reasons else self.under + 1
+            if self.under >= self.recover_checks:
+                self._release(load)
+        return load
+
+    def _engage(self, load, reasons):
+        if GuardrailAction.PAUSE == self.action:
+            self.cloner.pause()
+        else:
+            self.cloner.throttle(self.throttle_factor)
+        self.engaged, self.over = self.action, 0
+        self._record(self.action, load, reasons)
+
+    def _release(self, load):
+        if GuardrailAction.PAUSE == self.engaged:
+            self.cloner.resume()
+        else:
+            self.cloner.throttle(1.0)
+        self.engaged, self.under = None, 0
+        self._record(GuardrailAction.RESUME, load, [])
+
+    def _record(self, action, load, reasons):
+        intervention = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "action": action,
+            "reasons": reasons,
+            "load": load.to_dict()
+        }
+        self.interventions.append(intervention)
+        self.logger.warning("[GUARDRAIL] %s %s - %s" % (
+            intervention["timestamp"], action.upper(), ", ".join(reasons) or "host load is back to normal"))
@@ -0,0 +1,103 @@
+import bisect
+import hashlib
+
+__version__ = "0.1"
+
+__all__ = ["HashRing", "SplitKey", "SplitKeyException"]
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with `replicas` virtual nodes per node. Adding or removing one of N nodes moves
+    about 1/N of the keys, all of them to or from that node.
+    """
+
+    def __init__(self, nodes=(), replicas=160):
+        self.replicas = replicas
+        self.positions = []
+        self.owners = []
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for replica in range(self.replicas):
+            position = key_hash("%s#%d" % (node, replica))
+            index = bisect.bisect(self.positions, position)
+            self.positions.insert(index, position)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(position, owner) for position, owner in zip(self.positions, self.owners) if owner != node]
+        self.positions = [position for position, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def get(self, key):
+        if not self.positions:
+            return None
+        index = bisect.bisect(self.positions, key_hash(key))
+        return self.owners[index % len(self.owners)]
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class SplitKeyException(Exception):
+    pass
+
+
+class SplitKey:
+    """
+    Request attribute which keeps a user on one output host: "cookie:NAME", "header:NAME" or "path:INDEX",
+    where INDEX counts path segments from 0: "/users/42/orders" with "path:1" -> "42".
+    """
+    COOKIE = "cookie"
+    HEADER = "header"
+    PATH = "path"
+
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+
+    def __str__(self):
+        return "%s:%s" % (self.source, self.name)
+
+    @classmethod
+    def parse(cls, split_key):
+        source, _, name = str(split_key).partition(":")
+        if source not in (cls.COOKIE, cls.HEADER, cls.PATH) or not name:
+            raise SplitKeyException("Split key %s has incorrect format. Expects cookie:NAME, header:NAME "
+                                    "or path:INDEX" % split_key)
+        if source == cls.PATH:
+            if not name.isdigit():
+                raise SplitKeyException("Split key %s has incorrect format. Expects path:INDEX" % split_key)
+            return cls(source, int(name))
+        return cls(source, name)
+
+    def extract(self, request):
+        """
+        Returns the key of a request (anything with `path` and `header(name)`), None when it has none.
+        """
+        if self.source == self.PATH:
+            segments = request.path.split("?", 1)[0].strip("/").split("/")
+            if self.name < len(segments):
+                return segments[self.name] or None
+            return None
+        if self.source == self.HEADER:
+            return request.header(self.name) or None
+
+        for cookie in (request.header("Cookie") or "").split(";"):
+            name, _, value = cookie.strip().partition("=")
+            if name == self.name:
+                return value.strip('"') or None
+        return None
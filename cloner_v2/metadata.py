@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+
+__version__ = "0.1"
+
+__all__ = ["BinaryMetadata", "BinaryMetadataCache", "private_directory"]
+
+# shared with cloner/cloner-service-webserver.py run by the same user, in a directory only that user can write
+# to, anybody else could plant a forged version
+DEFAULT_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "gor-metadata-%d" % os.getuid())
+DEFAULT_CACHE_PATH = os.environ.get("GOR_METADATA_CACHE",
+                                    os.path.join(DEFAULT_CACHE_DIRECTORY, "gor-metadata.json"))
+
+
+def private_directory(path):
+    """
+    Creates the directory with mode 0700, or checks an existing one is owned by the current user and
+    closed to others. Raises OSError otherwise.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    status = os.lstat(path)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise OSError("%s is not a directory private to uid %d" % (path, os.getuid()))
+    return path
+
+
+class BinaryMetadata:
+    def __init__(self, path, inode, mtime_ns, size, version=None, return_code=None, probed_at=None):
+        self.path = path
+        self.inode = inode
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.version = version
+        self.return_code = return_code
+        self.probed_at = probed_at
+
+    def __str__(self):
+        return "BinaryMetadata(" \
+               "path=%s, " \
+               "version=%s, " \
+               "inode=%s, " \
+               "mtime_ns=%s, " \
+               "size=%s)" % (
+                   self.path,
+                   self.version,
+                   self.inode,
+                   self.mtime_ns,
+                   self.size
+               )
+
+    def key(self):
+        return self.inode, self.mtime_ns, self.size
+
+    def to_dict(self):
+        return {
+            "inode": self.inode,
+            "mtime_ns": self.mtime_ns,
+            "size": self.size,
+            "version": self.version,
+            "return_code": self.return_code,
+            "probed_at": self.probed_at
+        }
+
+    @classmethod
+    def from_dict(cls, path, dictionary):
+        return cls(path, **dictionary)
+
+    @classmethod
+    def of(cls, path):
+        stat = os.stat(path)
+        return cls(path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class BinaryMetadataCache:
+    """
+    Keeps the result of a version probe per binary and runs the probe again only when the binary's
+    inode, mtime or size changes. Entries are persisted in a JSON file shared between processes of the same
+    user, a file owned by anybody else is ignored.
+
+    `probe(path)` has to return a pair (version, return_code).
+    """
+
+    def __init__(self, probe, cache_path=DEFAULT_CACHE_PATH):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.probe = probe
+        self.cache_path = cache_path
+
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, path) -> BinaryMetadata:
+        path = os.path.realpath(path)
+        current = BinaryMetadata.of(path)
+
+        with self.lock:
+            cached = self.entries.get(path)
+            if cached is None or cached.key() != current.key():
+                cached = self._read().get(path)
+            if cached is not None and cached.key() == current.key():
+                self.entries[path] = cached
+                return cached
+
+            current.version, current.return_code = self.probe(path)
+            current.probed_at = time.time()
+            self.entries[path] = current
+            self._write(current)
+            self.logger.info("Probed %s" % current)
+            return current
+
+    def _read(self):
+        try:
+            with open(self.cache_path) as cache_file:
+                owner = os.fstat(cache_file.fileno()).st_uid
+                if owner != os.getuid():
+                    self.logger.error("Ignored cache file %s owned by uid %d" % (self.cache_path, owner))
+                    return {}
+                entries = json.load(cache_file)
+            return {path: BinaryMetadata.from_dict(path, entry) for path, entry in entries.items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, TypeError) as e:
+            self.logger.error("Ignored broken cache file %s - %s" % (self.cache_path, e))
+            return {}
+
+    def _write(self, metadata: BinaryMetadata):
+        entries = {path: entry.to_dict() for path, entry in self._read().items()}
+        entries[metadata.path] = metadata.to_dict()
+        try:
+            # write and rename, readers never see a partially written file
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            if directory == DEFAULT_CACHE_DIRECTORY:
+                private_directory(directory)
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as cache_file:
+                json.dump(entries, cache_file, sort_keys=True, indent=4)
+            os.replace(cache_file.name, self.cache_path)
+        except OSError as e:
+            self.logger.error("Couldn't write cache file %s - %s" % (self.cache_path, e))
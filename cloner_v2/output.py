@@ -0,0 +1,209 @@
+import logging
+import os
+import selectors
+import threading
+
+__version__ = "0.1"
+
+__all__ = ["RingBuffer", "LoggerSink", "FileSink", "CallbackSink", "LineSplitter", "StreamDrainer"]
+
+
+class RingBuffer:
+    """
+    Fixed-size byte buffer which keeps only the most recent `capacity` bytes written to it.
+    """
+
+    def __init__(self, capacity=64 * 1024):
+        if capacity <= 0:
+            raise ValueError("Capacity %s has to be greater than 0" % capacity)
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._end = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        with self._lock:
+            if len(data) >= self.capacity:
+                self._buffer[:] = data[-self.capacity:]
+                self._end = 0
+                self._size = self.capacity
+                return
+
+            first = min(len(data), self.capacity - self._end)
+            self._buffer[self._end:self._end + first] = data[:first]
+            rest = len(data) - first
+            if rest:
+                self._buffer[:rest] = data[first:]
+            self._end = (self._end + len(data)) % self.capacity
+            self._size = min(self.capacity, self._size + len(data))
+
+    def getvalue(self):
+        with self._lock:
+            if self._size < self.capacity:
+                return bytes(self._buffer[:self._size])
+            return bytes(self._buffer[self._end:] + self._buffer[:self._end])
+
+    def clear(self):
+        with self._lock:
+            self._end = 0
+            self._size = 0
+
+
+class LoggerSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger(self.__class__.__name__)
+        self.level = level
+
+    def write(self, name, line):
+        self.logger.log(self.level, "[%s] %s" % (name, line))
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, name, line):
+        with self._lock:
+            self._file.write("[%s] %s\n" % (name, line))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, name, line):
+        self.callback(name, line)
+
+    def close(self):
+        pass
+
+
+class LineSplitter:
+    """
+    Splits chunks of a stream into lines for `self.sinks`, lines longer than max_line_length are passed in
+    pieces. Needs `sinks` and `logger` attributes, `pending` keeps the unfinished line of a stream.
+    """
+
+    max_line_length = 8192
+
+    def _split_lines(self, name, pending, data):
+        pending += data
+        *lines, rest = pending.split(b"\n")
+        for line in lines:
+            self._dispatch(name, line)
+        pending[:] = rest
+        if len(pending) > self.max_line_length:
+            self._dispatch(name, bytes(pending))
+            pending.clear()
+
+    def _dispatch(self, name, line):
+        line = line.decode("utf-8", errors="replace").rstrip("\r")
+        for sink in self.sinks:
+            try:
+                sink.write(name, line)
+            except Exception as e:
+                self.logger.error("Sink %s couldn't handle line from %s - %s" % (sink, name, e))
+
+
+class StreamDrainer(LineSplitter):
+    """
+    Continuously reads the pipes of a child process in one background thread, so the child never blocks on a
+    full pipe. Every chunk lands in the stream's ring buffer and every complete line is passed to the sinks.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, name, sinks=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+        self.sinks = sinks if sinks is not None else []
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+        # the wakeup pipe belongs to the owner, stop() must never write to a closed (maybe reused) fd number
+        self._wakeup_lock = threading.Lock()
+        self._closed = False
+        self.thread = threading.Thread(
+            name="StreamDrainer-%s" % name,
+            target=self._drain,
+            daemon=True
+        )
+
+    def add(self, name, stream, buffer: RingBuffer):
+        fd = stream.fileno()
+        os.set_blocking(fd, False)
+        self._selector.register(fd, selectors.EVENT_READ, (name, buffer, bytearray()))
+        return self
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self._wakeup_lock:
+            if self._closed:
+                return
+            try:
+                os.write(self._wakeup_write, b"\0")
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Releases the wakeup pipe, to be called by the owner once the thread has been joined.
+        """
+        with self._wakeup_lock:
+            if self._closed:
+                return
+            self._closed = True
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def _drain(self):
+        try:
+            while len(self._selector.get_map()) > 1:
+                for key, _ in self._selector.select():
+                    if key.fd == self._wakeup_read:
+                        return
+                    self._read(key)
+        finally:
+            self._selector.close()
+
+    def _read(self, key):
+        name, buffer, pending = key.data
+        try:
+            data = os.read(key.fd, self.chunk_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            # EOF, the last line may not end with a new line
+            if pending:
+                self._dispatch(name, bytes(pending))
+            self._selector.unregister(key.fd)
+            return
+
+        buffer.write(data)
+        if self.sinks:
+            self._split_lines(name, pending, data)
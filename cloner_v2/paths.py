@@ -0,0 +1,190 @@
+import re
+
+from configuration import Paths
+from validator import Validator
+
+__version__ = "0.1"
+
+__all__ = ["PathRules", "PathRulesException", "PatternSet"]
+
+# gor (Go regexp) refers to groups as $1 or ${1}, Python as \g<1>
+GO_GROUP = re.compile(r"\$\{?(\w+)\}?")
+META = frozenset(".^$*+?{}[]\\|()")
+QUANTIFIERS = frozenset("*+?{")
+BACKREFERENCE = re.compile(r"\\\d|\(\?P=")
+
+
+class PathRulesException(Exception):
+    pass
+
+
+def go_replacement(replacement):
+    return GO_GROUP.sub(lambda match: "\\g<%s>" % match.group(1), replacement.replace("\\", "\\\\"))
+
+
+def literal_prefix(pattern):
+    """
+    Splits a pattern into its literal prefix and the rest: "/api/v[0-9]+" -> ("/api/v", "[0-9]+").
+    """
+    if "|" in pattern:
+        # a top level alternation applies to the whole pattern
+        return "", pattern
+    end = 0
+    while end < len(pattern) and pattern[end] not in META:
+        end += 1
+    if end < len(pattern) and pattern[end] in QUANTIFIERS:
+        # "/ab*" repeats "b" only
+        end = max(0, end - 1)
+    return pattern[:end], pattern[end:]
+
+
+class TrieNode:
+    __slots__ = ("children", "remainders")
+
+    def __init__(self):
+        self.children = {}
+        self.remainders = []
+
+
+def combine(patterns):
+    """
+    One regular expression matching wherever any of patterns matches. Literal prefixes of patterns are merged
+    into a trie, so searching costs about the same for ten and for ten thousand patterns with distinct prefixes.
+    """
+    root = TrieNode()
+    for pattern in patterns:
+        prefix, remainder = literal_prefix(pattern)
+        node = root
+        for character in prefix:
+            node = node.children.setdefault(character, TrieNode())
+        if remainder not in node.remainders:
+            node.remainders.append(remainder)
+    return re.compile(_trie_pattern(root))
+
+
+def _trie_pattern(node: TrieNode):
+    if "" in node.remainders:
+        # a literal ends here, longer patterns below can't match anything more
+        return ""
+    branches = ["(?:%s)" % remainder for remainder in node.remainders]
+    for character, child in sorted(node.children.items()):
+        branches.append(re.escape(character) + _trie_pattern(child))
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:%s)" % "|".join(branches)
+
+
+class Sequential:
+    # fallback for patterns which can't be combined, e.g. with backreferences
+    def __init__(self, patterns):
+        self.compiled = [re.compile(pattern) for pattern in patterns]
+
+    def search(self, path):
+        for pattern in self.compiled:
+            match = pattern.search(path)
+            if match:
+                return match
+        return None
+
+
+class PatternSet:
+    """
+    Regular expressions searched (unanchored, like Go regexp.MatchString) as one combined expression.
+    `first` finds the first pattern in list order which matches by bisecting combined halves of the list:
+    one search for a path nothing matches, O(log n) searches otherwise.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.combined = {}
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def compiled(self, index):
+        # re caches compiled patterns itself
+        return re.compile(self.patterns[index])
+
+    def _combined(self, start, stop):
+        combined = self.combined.get((start, stop))
+        if combined is None:
+            patterns = self.patterns[start:stop]
+            try:
+                if any(BACKREFERENCE.search(pattern) for pattern in patterns):
+                    raise re.error("backreferences refer to groups of one pattern")
+                combined = combine(patterns)
+            except re.error:
+                # e.g. inline flags which have to start the whole expression
+                combined = Sequential(patterns)
+            self.combined[(start, stop)] = combined
+        return combined
+
+    def search(self, path):
+        return bool(self.patterns) and self._combined(0, len(self.patterns)).search(path) is not None
+
+    def first(self, path):
+        start, stop = 0, len(self.patterns)
+        if not self.search(path):
+            return None
+        while stop - start > 1:
+            middle = (start + stop) // 2
+            if self._combined(start, middle).search(path) is not None:
+                stop = middle
+            else:
+                start = middle
+        return start
+
+
+class PathRules:
+    """
+    Allow, disallow and rewrite rules of Paths applied the way gor applies --http-allow-url,
+    --http-disallow-url and --http-rewrite-url: a path has to match any allow rule (if there are any)
+    and no disallow rule, then the first matching rewrite rule replaces it.
+    Rules are validated like ConfigurationValidator does and every list is matched as one PatternSet.
+    """
+
+    def __init__(self, paths: Paths = None):
+        allow = paths.allow if paths else []
+        disallow = paths.disallow if paths else []
+        rewrite = paths.rewrite if paths else []
+        self._validate(allow, disallow, rewrite)
+
+        self.allow = PatternSet(allow)
+        self.disallow = PatternSet(disallow)
+        patterns, replacements = [], []
+        for rewrite_path in rewrite:
+            pattern, replacement = rewrite_path.split(":")
+            patterns.append(pattern)
+            replacements.append(go_replacement(replacement))
+        self.rewrite = PatternSet(patterns)
+        self.replacements = replacements
+
+    @staticmethod
+    def _validate(allow, disallow, rewrite):
+        errors = ["Allow path %s has incorrect format" % path for path in allow
+                  if not Validator.is_url_path(path) or not Validator.is_regexp(path)]
+        errors += ["Disallow path %s has incorrect format" % path for path in disallow
+                   if not Validator.is_url_path(path) or not Validator.is_regexp(path)]
+        errors += ["Rewrite path %s has incorrect format. Expects ':' as a delimiter." % path for path in rewrite
+                   if not Validator.is_rewrite_path(path)]
+        if errors:
+            raise PathRulesException("; ".join(errors))
+
+    def is_allowed(self, path):
+        if self.allow and not self.allow.search(path):
+            return False
+        return not self.disallow.search(path)
+
+    def rewritten(self, path):
+        index = self.rewrite.first(path)
+        if index is None:
+            return path
+        return self.rewrite.compiled(index).sub(self.replacements[index], path)
+
+    def apply(self, path):
+        """
+        Returns the rewritten path or None when the path is filtered out.
+        """
+        if not self.is_allowed(path):
+            return None
+        return self.rewritten(path)
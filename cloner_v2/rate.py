@@ -0,0 +1,299 @@
+import copy
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlparse
+
+from configuration import Configuration
+
+__version__ = "0.1"
+
+__all__ = ["Rate", "HostProbe", "RateController", "host_keys", "output_hosts", "scale_rates"]
+
+
+class Rate:
+    """
+    gor rate of an output: "66%" of captured requests or "100" requests per second.
+    """
+
+    def __init__(self, value, percent=True):
+        self.value = value
+        self.percent = percent
+
+    def __str__(self):
+        # gor parses rates as integers
+        value = "%d" % max(1, round(self.value))
+        return value + "%" if self.percent else value
+
+    def scaled(self, factor, minimum=None, maximum=None):
+        value = self.value * factor
+        if minimum is not None:
+            value = max(minimum, value)
+        if maximum is not None:
+            value = min(maximum, value)
+        return Rate(value, self.percent)
+
+    @staticmethod
+    def parse(rate, default="100%"):
+        rate = str(rate or default).strip()
+        if rate.endswith("%"):
+            return Rate(float(rate[:-1]), True)
+        return Rate(float(rate), False)
+
+
+def output_hosts(configuration: Configuration):
+    """
+    Yields (output, host) for every HTTP and TCP output host, hosts are dicts {"host": ..., "rate": ...}.
+    """
+    for output in (configuration.output.http, configuration.output.tcp):
+        if output:
+            for host in output.hosts:
+                yield output, host
+
+
+def scale_rates(configuration: Configuration, factor, minimum=1.0) -> Configuration:
+    """
+    Returns a copy of the configuration with the rate of every output host multiplied by factor.
+    """
+    scaled = copy.deepcopy(configuration)
+    for output, host in output_hosts(scaled):
+        host["rate"] = str(Rate.parse(host.get("rate") or output.rate).scaled(factor, minimum=minimum))
+    return scaled
+
+
+class HostProbe:
+    """
+    Measures latency of an output host: a HEAD request for HTTP hosts, a TCP connect for TCP hosts.
+    Returns (latency in seconds, error).
+    """
+
+    def __init__(self, timeout=2.0, path="/"):
+        self.timeout = timeout
+        self.path = path
+
+    def probe(self, host, http=True):
+        started_at = time.monotonic()
+        try:
+            error = self._probe_http(host) if http else self._probe_tcp(host)
+        except (OSError, ValueError):
+            error = True
+        return time.monotonic() - started_at, error
+
+    def _probe_http(self, host):
+        url = urlparse(host)
+        connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        connection = connection_class(url.netloc, timeout=self.timeout)
+        try:
+            connection.request("HEAD", self.path)
+            return connection.getresponse().status >= 500
+        finally:
+            connection.close()
+
+    def _probe_tcp(self, host):
+        hostname, _, port = host.rpartition(":")
+        socket.create_connection((hostname, int(port)), timeout=self.timeout).close()
+        return False
+
+
+class HostState:
+    def __init__(self, output, host, configured: Rate, minimum, maximum, step, window):
+        self.output = output
+        self.host = host
+        self.configured = configured
+        self.rate = configured
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.samples = deque(maxlen=window)
+        self.high = 0
+        self.low = 0
+
+    def latency(self):
+        latencies = sorted(sample[0] for sample in self.samples)
+        return latencies[len(latencies) // 2] if latencies else 0.0
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for sample in self.samples if sample[1]) / len(self.samples)
+
+
+def host_keys(configuration: Configuration):
+    """
+    Yields (key, kind, output, host) for every output host. Keys are "http"/"tcp" and the host address, the
+    second and later entries of the same address get "#2", "#3"..., so keys survive reordering of other hosts.
+    """
+    for kind, output in (("http", configuration.output.http), ("tcp", configuration.output.tcp)):
+        if not output:
+            continue
+        seen = {}
+        for host in output.hosts:
+            seen[host["host"]] = seen.get(host["host"], 0) + 1
+            name = host["host"] if seen[host["host"]] == 1 else "%s#%d" % (host["host"], seen[host["host"]])
+            yield (kind, name), kind, output, host
+
+
+class RateController:
+    """
+    Adjusts the rate of every output host of a Cloner to the latency and error rate of that host.
+
+    A host slower than latency_high or failing more than error_high for `hysteresis` checks in a row gets its
+    rate multiplied by decrease_factor; a host faster than latency_low without errors for `hysteresis` checks
+    gets it raised by increase_ratio of its configured rate. Every host stays between min_ratio and max_ratio
+    of its configured rate, percent rates never go above 100% and absolute rates (requests per second) are
+    scaled the same way. Changes are applied through Cloner.reload, which overlaps the old and the new gor.
+    Configurations loaded later have to come through reload(), which rebuilds the host states.
+    """
+
+    def __init__(self, cloner, interval=10.0, window=6, hysteresis=3, latency_low=0.2, latency_high=1.0,
+                 error_high=0.05, decrease_factor=0.5, increase_ratio=0.1, min_ratio=0.01, max_ratio=1.0,
+                 probe: HostProbe = None, probe_concurrency=16):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.cloner = cloner
+        self.interval = interval
+        self.window = window
+        self.hysteresis = hysteresis
+        self.latency_low = latency_low
+        self.latency_high = latency_high
+        self.error_high = error_high
+        self.decrease_factor = decrease_factor
+        self.increase_ratio = increase_ratio
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.probe = probe or HostProbe()
+        self.probe_concurrency = probe_concurrency
+
+        self.lock = threading.Lock()
+        self.base = cloner.configuration
+        self.states = self._states(self.base, {})
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def _state(self, kind, host, configured: Rate):
+        maximum = configured.value * self.max_ratio
+        if configured.percent:
+            maximum = min(100.0, maximum)
+        # gor rates are integers, 1 is the lowest one
+        minimum = min(maximum, max(1.0, configured.value * self.min_ratio))
+        step = max(1.0, configured.value * self.increase_ratio)
+        state = HostState(kind, host, configured, minimum, maximum, step, self.window)
+        state.rate = Rate(min(maximum, max(minimum, configured.value)), configured.percent)
+        return state
+
+    def _states(self, configuration: Configuration, previous):
+        states = {}
+        for key, kind, output, host in host_keys(configuration):
+            configured = Rate.parse(host.get("rate") or output.rate)
+            state = previous.get(key)
+            if state is None or (state.configured.value, state.configured.percent) != \
+                    (configured.value, configured.percent):
+                state = self._state(kind, host["host"], configured)
+            states[key] = state
+        return states
+
+    def reload(self, configuration: Configuration):
+        """
+        Takes a new configuration (e.g. from ConfigurationWatcher): hosts which are still there keep their
+        adjusted rates unless their configured rate changed, then the cloner is reloaded.
+        """
+        with self.lock:
+            self.base = configuration
+            self.states = self._states(configuration, self.states)
+            adjusted = self.configuration()
+        return self.cloner.reload(adjusted)
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            name="RateControllerThread",
+            target=self._run,
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error("Couldn't adjust rates - %s" % e)
+
+    def check(self):
+        # probes run in parallel and outside the lock, a reload() meanwhile doesn't wait for slow hosts
+        with self.lock:
+            states = list(self.states.values())
+        if not states:
+            return False
+        with ThreadPoolExecutor(max_workers=min(self.probe_concurrency, len(states)),
+                                thread_name_prefix="RateControllerProbe") as executor:
+            samples = list(executor.map(lambda state: self.probe.probe(state.host, http=state.output == "http"),
+                                        states))
+
+        with self.lock:
+            changed = False
+            current = set(map(id, self.states.values()))
+            for state, sample in zip(states, samples):
+                if id(state) not in current:
+                    # replaced by reload() while probing
+                    continue
+                state.samples.append(sample)
+                changed |= self._adjust(state)
+            adjusted = self.configuration() if changed else None
+        if changed:
+            self.cloner.reload(adjusted)
+        return changed
+
+    def _adjust(self, state: HostState):
+        latency, error_rate = state.latency(), state.error_rate()
+        if latency > self.latency_high or error_rate > self.error_high:
+            state.high, state.low = state.high + 1, 0
+        elif latency < self.latency_low and error_rate == 0:
+            state.high, state.low = 0, state.low + 1
+        else:
+            state.high, state.low = 0, 0
+
+        rate = state.rate
+        if state.high >= self.hysteresis:
+            rate = rate.scaled(self.decrease_factor, state.minimum, state.maximum)
+        elif state.low >= self.hysteresis:
+            rate = Rate(min(state.maximum, rate.value + state.step), rate.percent)
+
+        if rate.value == state.rate.value:
+            return False
+        self.logger.info("[RATE] %s %s: %s -> %s (latency=%.3fs, errors=%.0f%%)" % (
+            state.output, state.host, state.rate, rate, latency, error_rate * 100))
+        state.rate = rate
+        state.high, state.low = 0, 0
+        return True
+
+    def configuration(self) -> Configuration:
+        """
+        The configuration last passed to reload() (the cloner's at start) with adjusted rates. The guardrail
+        throttle is applied by the cloner on top of it.
+        """
+        configuration = copy.deepcopy(self.base)
+        for key, _, _, host in host_keys(configuration):
+            state = self.states[key]
+            # a host left at its configured rate keeps its entry as it is (no rate means the default), so an
+            # unchanged configuration builds the same gor arguments
+            if str(state.rate) != str(state.configured):
+                host["rate"] = str(state.rate)
+        return configuration
+
+    def apply(self):
+        with self.lock:
+            adjusted = self.configuration()
+        return self.cloner.reload(adjusted)
+
+    def rates(self):
+        return {"%s %s" % key: str(state.rate) for key, state in self.states.items()}
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import random
+import ssl
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from capture import PayloadType, capture_files, read_records
+from capture_index import CaptureIndex
+from cloner import setup_logging
+from configuration import Configuration, ConfigurationReader
+from hashring import HashRing, SplitKey
+from paths import PathRules
+from rate import Rate
+from stats import percentile
+
+__version__ = "0.1"
+
+__all__ = ["ReplayException", "Replayer"]
+
+HEADERS_END = b"\r\n\r\n"
+# replaced for every target: gor sends the Host of the output, connections are kept alive by the pool
+HOP_HEADERS = (b"host", b"connection", b"keep-alive")
+
+
+class ReplayException(Exception):
+    pass
+
+
+class HttpRequest:
+    """
+    Raw request split around its target path and Host header, so it is rewritten once and addressed
+    to every output host cheaply.
+    """
+    __slots__ = ("method", "path", "head", "rest")
+
+    def __init__(self, method, path, head, rest):
+        self.method = method
+        self.path = path
+        self.head = head
+        self.rest = rest
+
+    @classmethod
+    def parse(cls, payload, rules: PathRules):
+        head, _, body = payload.partition(HEADERS_END)
+        lines = head.split(b"\r\n")
+        request_line = lines[0].split(b" ")
+        if len(request_line) != 3:
+            return None
+        method, target, version = request_line
+        path = rules.apply(target.decode("latin-1"))
+        if path is None:
+            return None
+
+        headers = [line for line in lines[1:] if line.split(b":", 1)[0].strip().lower() not in HOP_HEADERS]
+        headers.append(b"")
+        return cls(method, path, b"%s %s %s\r\nHost: " % (method, path.encode("latin-1"), version),
+                   b"\r\n" + b"\r\n".join(headers) + b"\r\n" + body)
+
+    def to_bytes(self, host_header):
+        return self.head + host_header + self.rest
+
+    def header(self, name):
+        name = name.lower().encode("latin-1")
+        for line in self.rest.split(HEADERS_END, 1)[0].split(b"\r\n"):
+            key, _, value = line.partition(b":")
+            if key.strip().lower() == name:
+                return value.strip().decode("latin-1")
+        return None
+
+
+async def read_response(reader, method):
+    """
+    Reads one response and returns (status, whether the connection has to be closed).
+    """
+    while True:
+        head = await reader.readuntil(HEADERS_END)
+        status = int(head[9:12])
+        # 100 Continue and other informational responses precede the real one
+        if status >= 200 or status == 101:
+            break
+
+    length, chunked, close = None, False, head.startswith(b"HTTP/1.0")
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"transfer-encoding":
+            chunked = b"chunked" in value.lower()
+        elif name == b"connection":
+            close = b"close" in value.lower()
+
+    if method == b"HEAD" or status in (204, 304):
+        return status, close
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+                return status, close
+            await reader.readexactly(size + 2)
+    if length is not None:
+        await reader.readexactly(length)
+        return status, close
+    # the body lasts until the server closes the connection
+    await reader.read()
+    return status, True
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections to one output host, at most `size` at once. Idle connections are reused
+    newest first, a request failing on a reused connection is retried once on a new one.
+    """
+
+    def __init__(self, url, size=64, timeout=5.0):
+        parsed = urlparse(url)
+        self.url = url
+        self.hostname = parsed.hostname
+        self.ssl = ssl.create_default_context() if parsed.scheme == "https" else None
+        self.port = parsed.port or (443 if self.ssl else 80)
+        self.host_header = parsed.netloc.encode("latin-1")
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def request(self, request: HttpRequest):
+        data = request.to_bytes(self.host_header)
+        async with self.slots:
+            if self.idle:
+                try:
+                    return await self._exchange(self.idle.pop(), data, request.method)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # the server closed the idle connection in the meantime
+                    pass
+            connection = await asyncio.wait_for(
+                asyncio.open_connection(self.hostname, self.port, ssl=self.ssl), self.timeout)
+            return await self._exchange(connection, data, request.method)
+
+    async def _exchange(self, connection, data, method):
+        reader, writer = connection
+        # aborting the transport on timeout is cheaper than wrapping every request in wait_for
+        timeout = asyncio.get_running_loop().call_later(self.timeout, writer.transport.abort)
+        try:
+            writer.write(data)
+            status, close = await read_response(reader, method)
+        except BaseException:
+            writer.transport.abort()
+            raise
+        finally:
+            timeout.cancel()
+        if close:
+            writer.close()
+        else:
+            self.idle.append(connection)
+        return status
+
+    def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
+
+
+class Target:
+    """
+    Output host with its gor rate: "50%" of requests or "100" requests per second.
+    """
+
+    def __init__(self, pool: ConnectionPool, rate: Rate):
+        self.pool = pool
+        self.rate = rate
+        self.second = None
+        self.sent = 0
+
+    def admit(self, now):
+        if self.rate.percent:
+            return self.rate.value >= 100 or random.random() * 100 < self.rate.value
+        second = int(now)
+        if second != self.second:
+            self.second, self.sent = second, 0
+        self.sent += 1
+        return self.sent <= self.rate.value
+
+
+class ReplayStats:
+    def __init__(self, window=10000):
+        self.started_at = None
+        self.finished_at = None
+        self.read = 0
+        self.filtered = 0
+        self.dropped = 0
+        self.sent = 0
+        self.errors = 0
+        self.statuses = {}
+        self.latencies = deque(maxlen=window)
+
+    def to_dict(self):
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at if self.started_at else 0.0
+        latencies = sorted(self.latencies)
+        return {
+            "elapsed": elapsed,
+            "read": self.read,
+            "filtered": self.filtered,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "errors": self.errors,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "requests_per_second": self.sent / elapsed if elapsed else 0.0,
+            "latency": {"p%d" % q: percentile(latencies, q) for q in (50, 90, 99)}
+        }
+
+
+class Replayer:
+    """
+    Replays requests of gor capture files to the HTTP output hosts of a configuration without gor.
+    Paths are filtered and rewritten by the input's rules. With speed > 0 the recorded gaps between
+    requests are kept, divided by speed (2.0 replays twice as fast), with speed 0 requests are sent
+    as fast as max_in_flight allows. With output.split_key every request goes to one host chosen by
+    a consistent-hash ring over its key, requests without the key are split round-robin.
+    """
+
+    def __init__(self, configuration: Configuration, speed=1.0, max_in_flight=256, connections=64, timeout=5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        http = configuration.output.http
+        if not http or not http.hosts:
+            raise ReplayException("Replay requires at least one output HTTP host")
+
+        self.rules = PathRules(configuration.input.paths)
+        self.speed = speed
+        self.max_in_flight = max_in_flight
+        self.split_traffic = configuration.output.split_traffic
+        self.targets = [Target(ConnectionPool(host["host"], connections, timeout),
+                               Rate.parse(host.get("rate") or http.rate)) for host in http.hosts]
+        self.next_target = 0
+        self.split_key = SplitKey.parse(configuration.output.split_key) if configuration.output.split_key else None
+        self.ring = None
+        if self.split_key:
+            # the same host listed twice is two nodes of the ring
+            names, seen = [], {}
+            for target in self.targets:
+                count = seen[target.pool.url] = seen.get(target.pool.url, 0) + 1
+                names.append(target.pool.url if count == 1 else "%s#%d" % (target.pool.url, count))
+            self.by_name = dict(zip(names, self.targets))
+            self.ring = HashRing(names)
+        self.stats = ReplayStats()
+
+    def _targets(self, request, now):
+        if self.ring:
+            key = self.split_key.extract(request)
+            if key is not None:
+                target = self.by_name[self.ring.get(key)]
+                return [target] if target.admit(now) else []
+        if self.split_traffic or self.ring:
+            # gor round-robins requests between outputs with --split-output
+            target = self.targets[self.next_target]
+            self.next_target = (self.next_target + 1) % len(self.targets)
+            return [target] if target.admit(now) else []
+        return [target for target in self.targets if target.admit(now)]
+
+    @staticmethod
+    def records(path, since=None, until=None, path_prefix=None):
+        """
+        Records of capture files, a time window (unix timestamps) or a path prefix are read through the index.
+        """
+        if since is None and until is None and not path_prefix:
+            yield from read_records(path)
+            return
+        since = int(since * 1e9) if since is not None else None
+        until = int(until * 1e9) if until is not None else None
+        for file_path in capture_files(path):
+            with CaptureIndex.open(file_path) as capture_index:
+                yield from capture_index.records(since, until, path_prefix)
+
+    async def replay(self, path, since=None, until=None, path_prefix=None):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.max_in_flight)
+        workers = [loop.create_task(self._work(queue)) for _ in range(self.max_in_flight)]
+
+        self.stats.started_at = time.monotonic()
+        started_at, first_timestamp = loop.time(), None
+        try:
+            for record in self.records(path, since, until, path_prefix):
+                if record.type != PayloadType.REQUEST:
+                    continue
+                self.stats.read += 1
+
+                if self.speed:
+                    if first_timestamp is None:
+                        first_timestamp = record.timestamp
+                    delay = started_at + (record.timestamp - first_timestamp) / 1e9 / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                request = HttpRequest.parse(record.payload, self.rules)
+                if request is None:
+                    self.stats.filtered += 1
+                    continue
+
+                targets = self._targets(request, loop.time())
+                if not targets:
+                    self.stats.dropped += 1
+                for target in targets:
+                    await queue.put((target, request))
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for target in self.targets:
+                target.pool.close()
+            self.stats.finished_at = time.monotonic()
+        return self.stats
+
+    async def _work(self, queue):
+        stats = self.stats
+        while True:
+            target, request = await queue.get()
+            started_at = time.perf_counter()
+            try:
+                status = await target.pool.request(request)
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+                stats.latencies.append(time.perf_counter() - started_at)
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError, asyncio.LimitOverrunError) as e:
+                stats.errors += 1
+                self.logger.debug("Couldn't replay %s %s to %s - %s" % (
+                    request.method, request.path, target.pool.url, e))
+            finally:
+                stats.sent += 1
+                queue.task_done()
+
+
+def timestamp(value):
+    # unix timestamp or ISO date and time, e.g. 2026-10-18T14:00:00+00:00
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Replays gor capture files without gor',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration-path', type=str, required=True,
+                        help='Path to configuration with output HTTP hosts and paths rules.')
+    parser.add_argument('--path', type=str, required=True,
+                        help='Capture file, .gz file or glob of files.')
+    parser.add_argument('--since', type=timestamp, default=None,
+                        help='Replay requests recorded from that time, seeks through the capture index.')
+    parser.add_argument('--until', type=timestamp, default=None,
+                        help='Replay requests recorded before that time, seeks through the capture index.')
+    parser.add_argument('--path-prefix', type=str, default=None,
+                        help='Replay only requests with that path prefix, filters through the capture index.')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Replay speed multiplier, 0 sends requests as fast as possible.')
+    parser.add_argument('--max-in-flight', type=int, default=256,
+                        help='Maximum number of requests waiting for a response.')
+    parser.add_argument('--connections', type=int, default=64,
+                        help='Maximum number of connections per output host.')
+    parser.add_argument('--timeout', type=float, default=5.0,
+                        help='Seconds to connect and to get a response.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    args = get_args()
+
+    replayer = Replayer(ConfigurationReader.read(args.configuration_path), speed=args.speed,
+                        max_in_flight=args.max_in_flight, connections=args.connections, timeout=args.timeout)
+    stats = asyncio.run(replayer.replay(args.path, args.since, args.until, args.path_prefix))
+    print(json.dumps(stats.to_dict(), indent=4))
@@ -0,0 +1,260 @@
+import copy
+import logging
+import os
+import re
+import signal
+import threading
+import time
+
+from command import Command
+from configuration import Configuration, InputType
+from gor import GorCommand
+from stats import GorStats
+
+__version__ = "0.1"
+
+__all__ = ["ShardStrategy", "ShardPlanner", "ShardedCloner"]
+
+
+class ShardStrategy:
+    # every shard captures the whole traffic and replays it to its own group of output hosts
+    OUTPUT = "output"
+    # every shard captures its own part of allowed paths and replays it to all output hosts
+    PATHS = "paths"
+
+
+class ShardException(Exception):
+    pass
+
+
+def partition(items: list, parts):
+    # round-robin keeps groups balanced: [a, b, c, d, e] / 2 -> [a, c, e], [b, d]
+    return [items[index::parts] for index in range(parts)]
+
+
+class ShardPlanner:
+    def __init__(self, configuration: Configuration, shards, strategy=ShardStrategy.OUTPUT):
+        self.configuration = configuration
+        self.shards = shards
+        self.strategy = strategy
+
+    def plan(self):
+        if self.shards < 1:
+            raise ShardException("Number of shards %s has to be greater than 0" % self.shards)
+        if self.shards == 1:
+            return [self.configuration]
+        if InputType.TCP == self.configuration.input.type:
+            raise ShardException("TCP input can't be sharded, every shard would listen on port %s"
+                                 % self.configuration.input.port)
+
+        if ShardStrategy.OUTPUT == self.strategy:
+            return self._plan_by_output()
+        if ShardStrategy.PATHS == self.strategy:
+            return self._plan_by_paths()
+        raise ShardException("Unknown shard strategy: %s" % self.strategy)
+
+    def _plan_by_output(self):
+        output = self.configuration.output
+        if output.split_traffic:
+            raise ShardException("Output sharding can't be combined with split_traffic, "
+                                 "every request would be sent once per shard")
+
+        http_groups = partition(output.http.hosts if output.http else [], self.shards)
+        tcp_groups = partition(output.tcp.hosts if output.tcp else [], self.shards)
+
+        configurations = []
+        for http_hosts, tcp_hosts in zip(http_groups, tcp_groups):
+            if not http_hosts and not tcp_hosts:
+                continue
+            shard = copy.deepcopy(self.configuration)
+            shard.output.http = self._with_hosts(shard.output.http, http_hosts)
+            shard.output.tcp = self._with_hosts(shard.output.tcp, tcp_hosts)
+            configurations.append(shard)
+        return configurations
+
+    @staticmethod
+    def _with_hosts(output, hosts):
+        if not output or not hosts:
+            return None
+        output.hosts = copy.deepcopy(hosts)
+        return output
+
+    def _plan_by_paths(self):
+        """
+        gor matches allow entries as unanchored regexes and takes a request matching any of them, so patterns
+        which match each other's text (e.g. /api and /api/v1) go to the same shard, otherwise two shards would
+        replay the same request. Overlaps which can't be seen that way (/a[0-9] and /a\\d) aren't detected,
+        allow entries of different groups have to be disjoint.
+        """
+        paths = self.configuration.input.paths
+        if not paths or not paths.allow:
+            raise ShardException("Paths sharding requires a non-empty list of allowed paths")
+
+        configurations = []
+        for groups in partition(overlapping_groups(paths.allow), self.shards):
+            if not groups:
+                continue
+            shard = copy.deepcopy(self.configuration)
+            shard.input.paths.allow = [path for group in groups for path in group]
+            configurations.append(shard)
+        return configurations
+
+
+def overlaps(pattern, other):
+    for regexp, text in ((pattern, other), (other, pattern)):
+        try:
+            if re.search(regexp, text):
+                return True
+        except re.error:
+            if regexp in text:
+                return True
+    return False
+
+
+def overlapping_groups(patterns):
+    """
+    Groups patterns which overlap directly or through other patterns, groups and their patterns keep the
+    order of the list.
+    """
+    groups = []
+    for pattern in patterns:
+        merged = [pattern]
+        for group in [group for group in groups if any(overlaps(pattern, other) for other in group)]:
+            groups.remove(group)
+            merged = group + merged
+        groups.append(merged)
+    return sorted(groups, key=lambda group: patterns.index(group[0]))
+
+
+class Shard:
+    def __init__(self, index, configuration: Configuration, gor_path="./gor", as_root=True, restart_delay=1.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.index = index
+        self.args = GorCommand(configuration, gor_path=gor_path, as_root=as_root).build()
+        self.restart_delay = restart_delay
+
+        self.command = None
+        self.gor_stats = GorStats()
+        self.restarts = 0
+        self.started_at = None
+        self.thread = None
+        self.stopping = threading.Event()
+        # orders creating a command against stop(), so a stop can't miss a command about to be executed
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.thread = threading.Thread(
+            name="ShardThread-%d" % self.index,
+            target=self._supervise,
+            daemon=True
+        )
+        self.thread.start()
+
+    def _supervise(self):
+        while True:
+            with self.lock:
+                if self.stopping.is_set():
+                    break
+                self.command = Command(self.args, sinks=[self.gor_stats], handle_signals=False)
+            self.started_at = time.monotonic()
+            try:
+                self.command.execute()
+            except Exception as e:
+                self.logger.error("[%d] Couldn't execute gor - %s" % (self.index, e))
+
+            if self.stopping.is_set():
+                break
+            self.restarts += 1
+            self.logger.error("[%d] gor exited with %s, restart #%d in %.1fs" % (
+                self.index, self.command.return_code, self.restarts, self.restart_delay))
+            self.stopping.wait(self.restart_delay)
+
+    def stop(self):
+        with self.lock:
+            self.stopping.set()
+            command = self.command
+        if command:
+            # a gor which is still starting has no pid to signal yet
+            while self.is_alive() and not command.started.wait(0.1):
+                pass
+            command.terminate()
+            command.request_stop()
+
+    def join(self, timeout=None):
+        if self.thread:
+            self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def metrics(self):
+        command = self.command
+        return {
+            "shard": self.index,
+            "pid": command.pid if command else -1,
+            "running": bool(command and command.return_code is None and self.is_alive()),
+            "restarts": self.restarts,
+            "uptime": time.monotonic() - self.started_at if self.started_at else 0.0,
+            "return_code": command.return_code if command else None,
+            "exit_latency": command.exit_latency if command else None
+        }
+
+
+class ShardedCloner:
+    """
+    Runs one configuration as several supervised gor processes, each restarted independently.
+    Exposes the same lifecycle methods as Cloner.
+    """
+
+    def __init__(self, configuration: Configuration, shards, strategy=ShardStrategy.OUTPUT, gor_path="./gor",
+                 as_root=True, restart_delay=1.0):
+        configurations = ShardPlanner(configuration, shards, strategy).plan()
+        self.shards = [Shard(index, shard_configuration, gor_path, as_root, restart_delay)
+                       for index, shard_configuration in enumerate(configurations)]
+
+        signal.signal(signal.SIGTERM, self.handler)
+
+    def handler(self, signum, frame):
+        self.stop()
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+
+    def wait_for_thread(self):
+        while any(shard.is_alive() for shard in self.shards):
+            for shard in self.shards:
+                shard.join(timeout=1)
+
+    def stop(self):
+        # every shard gets its own termination deadlines at the same time, not one after another
+        stoppers = [threading.Thread(name="ShardStop-%d" % shard.index, target=shard.stop, daemon=True)
+                    for shard in self.shards]
+        for stopper in stoppers:
+            stopper.start()
+        for stopper in stoppers:
+            stopper.join()
+        self.wait_for_thread()
+
+    def force_stop(self):
+        for shard in self.shards:
+            if shard.command and shard.command.pid > 0:
+                os.kill(shard.command.pid, signal.SIGKILL)
+
+    def details(self):
+        return "; ".join(" ".join(shard.args) for shard in self.shards)
+
+    def metrics(self):
+        shards = [shard.metrics() for shard in self.shards]
+        exit_latencies = [shard["exit_latency"] for shard in shards if shard["exit_latency"] is not None]
+        return {
+            "shards": shards,
+            "running": sum(1 for shard in shards if shard["running"]),
+            "restarts": sum(shard["restarts"] for shard in shards),
+            "max_exit_latency": max(exit_latencies) if exit_latencies else None,
+            "statistics": self.statistics()
+        }
+
+    def statistics(self):
+        return GorStats.merge(*[shard.gor_stats for shard in self.shards])
@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+from collections import deque
+
+__version__ = "0.1"
+
+__all__ = ["GorStats", "StatCounters"]
+
+# gor prints "<name>:latest,mean,max,count,count/second,gcount" every stats interval, e.g.
+# "output_http:12,8,40,2000,200,57". Every HTTP output reports as output_http whatever its host.
+STAT_LINE = re.compile(r"(?P<name>[^\s,]+):(?P<latest>-?\d+),(?P<mean>-?\d+),(?P<max>-?\d+),"
+                       r"(?P<count>-?\d+),(?P<rate>-?\d+),(?P<goroutines>-?\d+)\s*$")
+
+
+# every counter covers all outputs of one kind, see GorStats
+SCOPE = "aggregate"
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+class StatCounters:
+    """
+    Live counters of one gor stat name. `latest`, `mean` and `max` are queue lengths, `rate` is requests per
+    second and `goroutines` the number of goroutines serving the outputs.
+    gor reports every output of a kind under the same name, so reports arriving within `round_window`
+    seconds of each other are taken as one stats interval of several outputs and added up (max takes the
+    highest queue), `outputs` is the number of reports of the last interval.
+    """
+
+    def __init__(self, name, window=60, round_window=1.0):
+        self.name = name
+        self.round_window = round_window
+        self.round_started_at = None
+        self.outputs = 0
+        self.latest = 0
+        self.mean = 0
+        self.max = 0
+        self.count = 0
+        self.rate = 0
+        self.goroutines = 0
+        self.updated_at = None
+        # (timestamp, queue length, rate) of the last `window` reports
+        self.history = deque(maxlen=window)
+
+    def update(self, latest, mean, max, count, rate, goroutines, timestamp=None):
+        timestamp = timestamp or time.time()
+        if self.round_started_at is not None and timestamp - self.round_started_at < self.round_window:
+            # another output of the same interval
+            latest, mean, count, rate, goroutines = (self.latest + latest, self.mean + mean, self.count + count,
+                                                     self.rate + rate, self.goroutines + goroutines)
+            max = max if max > self.max else self.max
+            self.outputs += 1
+            self.history.pop()
+        else:
+            self.round_started_at = timestamp
+            self.outputs = 1
+
+        self.latest = latest
+        self.mean = mean
+        self.max = max
+        self.count = count
+        self.rate = rate
+        self.goroutines = goroutines
+        self.updated_at = timestamp
+        self.history.append((self.updated_at, latest, rate))
+
+    def percentiles(self, qs=(50, 90, 99)):
+        queue = sorted(sample[1] for sample in self.history)
+        rate = sorted(sample[2] for sample in self.history)
+        return {
+            "queue": {"p%d" % q: percentile(queue, q) for q in qs},
+            "rate": {"p%d" % q: percentile(rate, q) for q in qs}
+        }
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "scope": SCOPE,
+            "queue": self.latest,
+            "queue_mean": self.mean,
+            "queue_max": self.max,
+            "count": self.count,
+            "rate": self.rate,
+            "goroutines": self.goroutines,
+            "outputs": self.outputs,
+            "updated_at": self.updated_at,
+            "percentiles": self.percentiles()
+        }
+
+
+class GorStats:
+    """
+    Parses gor's periodic stats lines into live counters per stat name. Works as an output sink of Command.
+
+    Counters are aggregate over all outputs of a kind (e.g. all HTTP hosts), metrics say so with
+    "scope": "aggregate". gor's stats carry neither the host nor latencies, so there are no per-host
+    counters and no latency percentiles, percentiles are of queue length and rate.
+    """
+
+    def __init__(self, window=60):
+        self.window = window
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def write(self, name, line):
+        self.feed(line)
+
+    def close(self):
+        pass
+
+    def feed(self, line, timestamp=None):
+        match = STAT_LINE.search(line)
+        if not match:
+            return False
+        values = [int(match.group(group)) for group in ("latest", "mean", "max", "count", "rate", "goroutines")]
+        with self.lock:
+            counters = self.counters.get(match.group("name"))
+            if counters is None:
+                counters = self.counters[match.group("name")] = StatCounters(match.group("name"), self.window)
+            counters.update(*values, timestamp=timestamp)
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            return {name: counters.to_dict() for name, counters in self.counters.items()}
+
+    def total_rate(self):
+        with self.lock:
+            return sum(counters.rate for counters in self.counters.values())
+
+    @classmethod
+    def merge(cls, *stats):
+        """
+        Combines stats of several cloners: rates, counts, queue lengths and goroutines are summed per stat name,
+        queue maximums take the highest value.
+        """
+        merged = {}
+        for gor_stats in stats:
+            for name, counters in gor_stats.snapshot().items():
+                total = merged.setdefault(name, {"name": name, "scope": SCOPE, "queue": 0, "queue_mean": 0, "queue_max": 0,
+                                                 "count": 0, "rate": 0, "goroutines": 0, "outputs": 0,
+                                                 "sources": 0})
+                for key in ("queue", "queue_mean", "count", "rate", "goroutines", "outputs"):
+                    total[key] += counters[key]
+                total["queue_max"] = max(total["queue_max"], counters["queue_max"])
+                total["sources"] += 1
+        return merged
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from asyncio.subprocess import PIPE
+
+from cloner import setup_logging
+from configuration import Configuration, ConfigurationReader
+from gor import GorCommand
+from output import LineSplitter, RingBuffer
+from termination import Terminator
+
+__version__ = "0.1"
+
+__all__ = ["AsyncCommand", "Supervisor"]
+
+
+def use_pidfd_child_watcher():
+    """
+    Before Python 3.12 asyncio waits for every child in a dedicated thread. A pidfd watcher keeps
+    hundreds of gor processes on the event loop itself.
+    """
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, "PidfdChildWatcher"):
+        return False
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        return False
+    asyncio.set_child_watcher(asyncio.PidfdChildWatcher())
+    return True
+
+
+class AsyncCommand(LineSplitter):
+    pid = -1
+    return_code = None
+    exit_latency = None
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, command, stop_timeout=5.0, kill_timeout=2.0, buffer_size=64 * 1024, sinks=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.command = command
+        self.stop_timeout = stop_timeout
+        self.kill_timeout = kill_timeout
+        self.terminator = Terminator(term_timeout=stop_timeout, kill_timeout=kill_timeout)
+        self.sinks = sinks or []
+
+        self.proc = None
+        self.drainers = []
+        self.stdout_buffer = RingBuffer(buffer_size)
+        self.stderr_buffer = RingBuffer(buffer_size)
+
+    async def start(self):
+        # own process group, so sudo and the gor it runs as root are signalled together
+        self.proc = await asyncio.create_subprocess_exec(*self.command, stdout=PIPE, stderr=PIPE,
+                                                         start_new_session=True)
+        self.pid = self.proc.pid
+        self.drainers = [
+            asyncio.ensure_future(self._drain("stdout", self.proc.stdout, self.stdout_buffer)),
+            asyncio.ensure_future(self._drain("stderr", self.proc.stderr, self.stderr_buffer))
+        ]
+        self.logger.info("[%s] Started command - %s" % (self.pid, self.command))
+        return self
+
+    async def _drain(self, name, stream, buffer):
+        # chunks instead of readline(), which raises on lines longer than the stream limit
+        pending = bytearray()
+        while True:
+            data = await stream.read(self.chunk_size)
+            if not data:
+                # EOF, the last line may not end with a new line
+                if pending:
+                    self._dispatch(name, bytes(pending))
+                return
+            buffer.write(data)
+            if self.sinks:
+                self._split_lines(name, pending, data)
+
+    async def wait(self):
+        self.return_code = await self.proc.wait()
+        return self.return_code
+
+    async def stop(self):
+        if not self.proc or self.proc.returncode is not None:
+            return self.return_code
+
+        loop = asyncio.get_running_loop()
+        stop_requested_at = time.monotonic()
+        pgid = Terminator.pgid(self.proc.pid)
+        for signum, timeout in ((signal.SIGTERM, self.stop_timeout), (signal.SIGKILL, self.kill_timeout)):
+            try:
+                # `sudo kill` of a root gor blocks, it runs in a thread
+                await loop.run_in_executor(None, self.terminator.send, pgid, signum, timeout)
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(self.proc.wait()), timeout)
+                break
+            except asyncio.TimeoutError:
+                self.logger.error("[%s] Still running %.1fs after %s - %s" % (
+                    self.pid, timeout, signal.Signals(signum).name, self.command))
+        else:
+            self.logger.error("[%s] Couldn't stop, left behind - %s" % (self.pid, self.command))
+            return self.return_code
+
+        self.return_code = await self.proc.wait()
+        self.exit_latency = time.monotonic() - stop_requested_at
+        for drainer in self.drainers:
+            drainer.cancel()
+        return self.return_code
+
+    @property
+    def stdout(self):
+        return self.stdout_buffer.getvalue().decode("utf-8", errors="replace").strip()
+
+    @property
+    def stderr(self):
+        return self.stderr_buffer.getvalue().decode("utf-8", errors="replace").strip()
+
+
+class ClonerInstance:
+    def __init__(self, name, configuration: Configuration, gor_path="./gor", as_root=True):
+        self.name = name
+        self.configuration = configuration
+        self.gor_command = GorCommand(configuration, gor_path=gor_path, as_root=as_root)
+        self.args = self.gor_command.build()
+
+        self.command = None
+        self.watcher = None
+        self.restarts = 0
+        self.stopping = False
+        self.stopped = None
+
+    def status(self):
+        command = self.command
+        return {
+            "name": self.name,
+            "pid": command.pid if command else -1,
+            "running": bool(command and command.return_code is None and not self.stopping),
+            "restarts": self.restarts,
+            "return_code": command.return_code if command else None,
+            "exit_latency": command.exit_latency if command else None
+        }
+
+
+class Supervisor:
+    """
+    Starts, stops and watches many gor instances from one event loop.
+    Every lifecycle operation on a group of instances runs in parallel.
+    """
+
+    def __init__(self, gor_path="./gor", as_root=True, restart_delay=1.0, max_restart_delay=60.0, stop_timeout=5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.gor_path = gor_path
+        self.as_root = as_root
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+
+        self.instances = {}
+
+    def add(self, name, configuration: Configuration):
+        if name in self.instances:
+            raise Exception("Cloner %s is already supervised" % name)
+        self.instances[name] = ClonerInstance(name, configuration, self.gor_path, self.as_root)
+        return self.instances[name]
+
+    def _select(self, names):
+        if names is None:
+            return list(self.instances.values())
+        return [self.instances[name] for name in names]
+
+    async def start(self, names=None):
+        instances = self._select(names)
+        await asyncio.gather(*[self._start(instance) for instance in instances])
+        return [instance.status() for instance in instances]
+
+    async def _start(self, instance: ClonerInstance):
+        if instance.watcher is not None and not instance.watcher.done():
+            # the watcher owns the running gor (or is restarting it), a second one would be orphaned
+            self.logger.warning("[%s] Already running, not started again" % instance.name)
+            return
+        instance.stopping = False
+        instance.stopped = asyncio.Event()
+        command = AsyncCommand(instance.args, stop_timeout=self.stop_timeout)
+        await command.start()
+        instance.command = command
+        instance.watcher = asyncio.ensure_future(self._watch(instance))
+
+    async def _watch(self, instance: ClonerInstance):
+        while True:
+            return_code = await instance.command.wait()
+            if instance.stopping:
+                return
+            instance.restarts += 1
+            self.logger.error("[%s] gor exited with %s, restart #%d in %.1fs" % (
+                instance.name, return_code, instance.restarts, self.restart_delay))
+            if not await self._restart(instance):
+                return
+
+    async def _restart(self, instance: ClonerInstance):
+        """
+        Starts gor again after restart_delay, doubling the delay up to max_restart_delay while it can't be
+        started. Returns False when the instance was stopped meanwhile.
+        """
+        delay = self.restart_delay
+        while True:
+            try:
+                await asyncio.wait_for(instance.stopped.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            if instance.stopping:
+                return False
+            command = AsyncCommand(instance.args, stop_timeout=self.stop_timeout)
+            try:
+                await command.start()
+            except Exception as e:
+                delay = min(self.max_restart_delay, delay * 2)
+                self.logger.error("[%s] Couldn't restart gor - %s, next attempt in %.1fs" % (instance.name, e, delay))
+                continue
+            if instance.stopping:
+                await command.stop()
+                return False
+            instance.command = command
+            return True
+
+    async def stop(self, names=None):
+        instances = self._select(names)
+        await asyncio.gather(*[self._stop(instance) for instance in instances])
+        return [instance.status() for instance in instances]
+
+    async def _stop(self, instance: ClonerInstance):
+        instance.stopping = True
+        if instance.stopped:
+            instance.stopped.set()
+        if instance.command:
+            await instance.command.stop()
+        if instance.watcher:
+            if instance.command and instance.command.proc and instance.command.proc.returncode is None:
+                # gor couldn't be stopped, don't wait for it forever
+                instance.watcher.cancel()
+            await asyncio.gather(instance.watcher, return_exceptions=True)
+
+    def status(self):
+        return [instance.status() for instance in self.instances.values()]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Cloner supervisor',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration-path', type=str, nargs='+',
+                        required=True,
+                        help='Paths to configurations, one gor instance per configuration.')
+    parser.add_argument('--gor-path', type=str, default='./gor',
+                        help='Path to gor.')
+    return parser.parse_args()
+
+
+async def run(args):
+    supervisor = Supervisor(gor_path=args.gor_path)
+    for path in args.configuration_path:
+        supervisor.add(path, ConfigurationReader.read(path))
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+
+    await supervisor.start()
+    logging.info("[START] Started %d cloners" % len(supervisor.instances))
+    try:
+        await stopped.wait()
+    finally:
+        await supervisor.stop()
+        logging.info("[STOP] Stopped %d cloners" % len(supervisor.instances))
+
+
+if __name__ == '__main__':
+    setup_logging()
+    use_pidfd_child_watcher()
+    asyncio.run(run(get_args()))
@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+__version__ = "0.1"
+
+__all__ = ["ProcSample", "ProcReader", "ProcessTelemetry"]
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class ProcSample:
+    """
+    Resources used by a process tree (e.g. sudo and gor) at one point in time.
+    Fields which couldn't be read (root owned /proc entries) are None.
+    """
+
+    __slots__ = ("timestamp", "pids", "cpu_user", "cpu_system", "cpu_percent", "rss", "voluntary_switches",
+                 "involuntary_switches", "fds", "read_bytes", "write_bytes")
+
+    def __init__(self, timestamp, pids, cpu_user=0.0, cpu_system=0.0, cpu_percent=None, rss=0,
+                 voluntary_switches=0, involuntary_switches=0, fds=None, read_bytes=None, write_bytes=None):
+        self.timestamp = timestamp
+        self.pids = pids
+        self.cpu_user = cpu_user
+        self.cpu_system = cpu_system
+        self.cpu_percent = cpu_percent
+        self.rss = rss
+        self.voluntary_switches = voluntary_switches
+        self.involuntary_switches = involuntary_switches
+        self.fds = fds
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+
+    def cpu_time(self):
+        return self.cpu_user + self.cpu_system
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def add(total, value):
+    if value is None:
+        return total
+    return (total or 0) + value
+
+
+class ProcReader:
+    """
+    Reads /proc/<pid>/{stat,status,io,fd} of a process and all its descendants.
+    """
+
+    def __init__(self, proc="/proc"):
+        self.proc = proc
+
+    def sample(self, pid, previous: ProcSample = None) -> ProcSample:
+        pids = self.tree(pid)
+        sample = ProcSample(time.time(), pids)
+        for child in pids:
+            self._add_stat(sample, child)
+            self._add_status(sample, child)
+            self._add_io(sample, child)
+            sample.fds = add(sample.fds, self._fds(child))
+
+        if previous is not None and sample.timestamp > previous.timestamp:
+            cpu = sample.cpu_time() - previous.cpu_time()
+            sample.cpu_percent = max(0.0, cpu / (sample.timestamp - previous.timestamp) * 100)
+        return sample
+
+    def tree(self, pid):
+        pids = []
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            pids.append(current)
+            pending += self._children(current)
+        return pids
+
+    def _children(self, pid):
+        try:
+            with open("%s/%d/task/%d/children" % (self.proc, pid, pid)) as children:
+                return [int(child) for child in children.read().split()]
+        except OSError:
+            return []
+
+    def _read(self, pid, name):
+        try:
+            with open("%s/%d/%s" % (self.proc, pid, name)) as proc_file:
+                return proc_file.read()
+        except OSError:
+            return None
+
+    def _add_stat(self, sample, pid):
+        stat = self._read(pid, "stat")
+        if not stat:
+            return
+        # comm may contain spaces and parentheses, fields are counted from the last ')'
+        fields = stat[stat.rindex(")") + 2:].split()
+        sample.cpu_user += int(fields[11]) / CLOCK_TICKS
+        sample.cpu_system += int(fields[12]) / CLOCK_TICKS
+        sample.rss += int(fields[21]) * PAGE_SIZE
+
+    def _add_status(self, sample, pid):
+        status = self._read(pid, "status")
+        if not status:
+            return
+        for line in status.splitlines():
+            if line.startswith("voluntary_ctxt_switches:"):
+                sample.voluntary_switches += int(line.split()[1])
+            elif line.startswith("nonvoluntary_ctxt_switches:"):
+                sample.involuntary_switches += int(line.split()[1])
+
+    def _add_io(self, sample, pid):
+        io = self._read(pid, "io")
+        if not io:
+            return
+        for line in io.splitlines():
+            # rchar/wchar count socket traffic too, which is most of what gor does
+            if line.startswith("rchar:"):
+                sample.read_bytes = add(sample.read_bytes, int(line.split()[1]))
+            elif line.startswith("wchar:"):
+                sample.write_bytes = add(sample.write_bytes, int(line.split()[1]))
+
+    def _fds(self, pid):
+        try:
+            return len(os.listdir("%s/%d/fd" % (self.proc, pid)))
+        except OSError:
+            return None
+
+
+class ProcessTelemetry:
+    """
+    Samples a supervised process tree every `interval` seconds into a fixed-size time series.
+    `pid_provider()` is asked for the pid on every sample, so restarted or reloaded processes are followed.
+    """
+
+    def __init__(self, pid_provider, interval=5.0, capacity=720, reader: ProcReader = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.pid_provider = pid_provider
+        self.interval = interval
+        self.reader = reader or ProcReader()
+
+        self.series = deque(maxlen=capacity)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            name="TelemetryThread",
+            target=self._run,
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.error("Couldn't sample process - %s" % e)
+
+    def sample(self):
+        pid = self.pid_provider()
+        if pid is None or pid <= 0:
+            return None
+        previous = self.series[-1] if self.series and self.series[-1].pids[0] == pid else None
+        sample = self.reader.sample(pid, previous)
+        self.series.append(sample)
+        return sample
+
+    def latest(self) -> ProcSample:
+        return self.series[-1] if self.series else None
+
+    def samples(self, since=None):
+        if since is None:
+            return list(self.series)
+        return [sample for sample in self.series if sample.timestamp >= since]
+
+    def to_json(self, since=None):
+        return json.dumps([sample.to_dict() for sample in self.samples(since)], sort_keys=True)
@@ -0,0 +1,122 @@
+import logging
+import os
+import signal
+import subprocess
+import time
+
+__version__ = "0.1"
+
+__all__ = ["Terminator", "TerminationResult", "TerminationStage"]
+
+
+class TerminationStage:
+    ALREADY_EXITED = "already_exited"
+    SIGTERM = "sigterm"
+    SIGKILL = "sigkill"
+    PRIVILEGED_SIGTERM = "privileged_sigterm"
+    PRIVILEGED_SIGKILL = "privileged_sigkill"
+    FAILED = "failed"
+
+
+class TerminationResult:
+    def __init__(self, pid, stage, elapsed, success):
+        self.pid = pid
+        self.stage = stage
+        self.elapsed = elapsed
+        self.success = success
+
+    def __str__(self):
+        return "TerminationResult(" \
+               "pid=%s, " \
+               "stage=%s, " \
+               "elapsed=%.3fms, " \
+               "success=%s)" % (
+                   self.pid,
+                   self.stage,
+                   self.elapsed * 1000,
+                   self.success
+               )
+
+    def to_dict(self):
+        return {
+            "pid": self.pid,
+            "stage": self.stage,
+            "elapsed": self.elapsed,
+            "success": self.success
+        }
+
+
+class Terminator:
+    """
+    Stops a process group with explicit deadlines: SIGTERM, then SIGKILL after term_timeout.
+    When the group belongs to root (gor under sudo) every stage is a single `sudo -n kill` invocation.
+
+    `wait_for_exit(timeout)` has to block until the process exits and return True, or return False on timeout.
+    """
+
+    def __init__(self, term_timeout=5.0, kill_timeout=2.0, sudo="sudo"):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.term_timeout = term_timeout
+        self.kill_timeout = kill_timeout
+        self.sudo = sudo
+
+    def terminate(self, pid, wait_for_exit) -> TerminationResult:
+        return self._signal(pid, wait_for_exit, (
+            (signal.SIGTERM, self.term_timeout, TerminationStage.SIGTERM, TerminationStage.PRIVILEGED_SIGTERM),
+            (signal.SIGKILL, self.kill_timeout, TerminationStage.SIGKILL, TerminationStage.PRIVILEGED_SIGKILL)
+        ))
+
+    def kill(self, pid, wait_for_exit) -> TerminationResult:
+        """
+        Only the SIGKILL stage, for a process group which already had its time to exit.
+        """
+        return self._signal(pid, wait_for_exit, (
+            (signal.SIGKILL, self.kill_timeout, TerminationStage.SIGKILL, TerminationStage.PRIVILEGED_SIGKILL),
+        ))
+
+    def _signal(self, pid, wait_for_exit, stages) -> TerminationResult:
+        started_at = time.monotonic()
+        pgid = self.pgid(pid)
+
+        for signum, timeout, stage, privileged_stage in stages:
+            try:
+                if self.send(pgid, signum, timeout):
+                    stage = privileged_stage
+            except ProcessLookupError:
+                return TerminationResult(pid, TerminationStage.ALREADY_EXITED, time.monotonic() - started_at, True)
+
+            if wait_for_exit(timeout):
+                return TerminationResult(pid, stage, time.monotonic() - started_at, True)
+            self.logger.error("[%s] Still running %.1fs after %s" % (pid, timeout, stage))
+
+        return TerminationResult(pid, TerminationStage.FAILED, time.monotonic() - started_at, False)
+
+    def send(self, pgid, signum, timeout):
+        """
+        Signals the process group, through `sudo -n kill` when it belongs to root. Returns True when sudo was
+        needed, raises ProcessLookupError when the group is gone.
+        """
+        try:
+            os.killpg(pgid, signum)
+            return False
+        except PermissionError:
+            self._kill_as_root(pgid, signum, timeout)
+            return True
+
+    @staticmethod
+    def pgid(pid):
+        try:
+            return os.getpgid(pid)
+        except OSError:
+            return pid
+
+    def _kill_as_root(self, pgid, signum, timeout):
+        sudo_kill = [self.sudo, "-n", "kill", "-s", signal.Signals(signum).name[3:], "--", "-%d" % pgid]
+        try:
+            result = subprocess.run(sudo_kill, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+            if result.returncode != 0:
+                self.logger.error("[%s] Executed command %s returns %s - %s" % (
+                    pgid, " ".join(sudo_kill), result.returncode, result.stderr.decode('utf-8').strip()))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.error("[%s] Couldn't execute command %s - %s" % (pgid, " ".join(sudo_kill), e))
@@ -1,32 +1,49 @@
 import re
+from functools import lru_cache
 from urllib.parse import urlparse
 
-__all__ = ["Validator"]
+from configuration import InputType
+from hashring import SplitKey, SplitKeyException
+
+__all__ = ["Validator", "ConfigurationValidator"]
 
 __version__ = "0.1"
 
+HOSTNAME_LABEL = re.compile("(?!-)[A-Z\d-]{1,63}(?<!-)$", re.IGNORECASE)
+URL_SCHEMES = frozenset(["ftp", "http", "https"])
+# gor sizes ("32mb"), replay speeds ("200%") and Go durations ("1s", "1m30s")
+SIZE = re.compile(r"\d+(b|kb|mb|gb|tb)?$", re.IGNORECASE)
+SPEED = re.compile(r"\d+%$")
+DURATION = re.compile(r"(\d+(\.\d+)?(ns|us|ms|s|m|h))+$")
+
+# configurations repeat the same hosts and paths, every distinct value is checked once
+CACHE_SIZE = 64 * 1024
+
 
 class Validator:
     @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
     def is_hostname(hostname):
-        if len(hostname) > 255:
+        if not hostname or len(hostname) > 255:
             return False
         if hostname[-1] == ".":
             hostname = hostname[:-1]  # strip exactly one dot from the right, if present
-        allowed = re.compile("(?!-)[A-Z\d-]{1,63}(?<!-)$", re.IGNORECASE)
-        return all(allowed.match(x) for x in hostname.split("."))
+        return all(HOSTNAME_LABEL.match(x) for x in hostname.split("."))
 
     @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
     def is_url(url):
         parsed_url = urlparse(url)
-        return parsed_url.scheme in ["ftp", "http", "https"]
+        return parsed_url.scheme in URL_SCHEMES
 
     @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
     def is_url_path(path):
         parsed_path = urlparse(path)
         return parsed_path.path and parsed_path.path.startswith("/")
 
     @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
     def is_regexp(regexp):
         try:
             re.compile(regexp)
@@ -35,8 +52,114 @@ class Validator:
             return False
 
     @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def is_size(size):
+        return bool(SIZE.match(size))
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def is_speed(speed):
+        return bool(SPEED.match(speed)) and int(speed[:-1]) > 0
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def is_duration(duration):
+        return bool(DURATION.match(duration))
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
     def is_rewrite_path(rewrite_path):
         parts = rewrite_path.split(":")
         if len(parts) == 2:
             return Validator.is_regexp(parts[0])
         return False
+
+    @classmethod
+    def cache_clear(cls):
+        """
+        Empties the caches of every check, e.g. to measure them cold.
+        """
+        for check in vars(cls).values():
+            check = getattr(check, "__func__", check)
+            if hasattr(check, "cache_clear"):
+                check.cache_clear()
+
+
+class ConfigurationValidator:
+    """
+    Checks a whole configuration in one pass and returns every error at once, instead of failing on the first one.
+    """
+
+    def validate(self, configuration):
+        errors = []
+        if not configuration:
+            return errors
+
+        self._validate_input(configuration.input, errors)
+        self._validate_paths(configuration.input.paths, errors)
+
+        output = configuration.output
+        if output.http:
+            self._validate_hosts(output.http.hosts, "HTTP", self._is_http_host, errors)
+        if output.tcp:
+            self._validate_hosts(output.tcp.hosts, "TCP", self._is_tcp_host, errors)
+        if output.file:
+            self._validate_output_file(output.file, errors)
+        if output.split_key:
+            try:
+                SplitKey.parse(output.split_key)
+            except SplitKeyException as e:
+                errors.append(str(e))
+        return errors
+
+    @staticmethod
+    def _validate_input(input, errors):
+        if InputType.FILE == input.type:
+            if not input.file or not input.file.path:
+                errors.append("FILE input requires a file path")
+            elif input.file.speed and not Validator.is_speed(input.file.speed):
+                errors.append("Input file speed %s has incorrect format. Expects e.g. 200%%" % input.file.speed)
+            return
+        if input.type not in (InputType.RAW, InputType.TCP):
+            return
+        if not isinstance(input.port, int) or input.port <= 0:
+            errors.append("%s port %s has to be greater than 0" % (str(input.type).upper(), input.port))
+
+    @staticmethod
+    def _validate_paths(paths, errors):
+        if not paths:
+            return
+        for path in paths.allow:
+            if not Validator.is_url_path(path):
+                errors.append("Allow path %s has incorrect format" % path)
+        for path in paths.disallow:
+            if not Validator.is_url_path(path):
+                errors.append("Disallow path %s has incorrect format" % path)
+        for rewrite_path in paths.rewrite:
+            if not Validator.is_rewrite_path(rewrite_path):
+                errors.append("Rewrite path %s has incorrect format. Expects ':' as a delimiter." % rewrite_path)
+
+    @staticmethod
+    def _validate_output_file(file, errors):
+        if not file.path:
+            errors.append("Output file path is empty")
+        if file.size_limit and not Validator.is_size(file.size_limit):
+            errors.append("Output file size limit %s has incorrect format. Expects e.g. 32mb" % file.size_limit)
+        if file.flush_interval and not Validator.is_duration(file.flush_interval):
+            errors.append("Output file flush interval %s has incorrect format. Expects e.g. 1s" % file.flush_interval)
+
+    @staticmethod
+    def _validate_hosts(hosts, kind, is_valid, errors):
+        if len(hosts) == 0:
+            errors.append("List of output's %s hosts is empty" % kind)
+        for host in hosts:
+            if not is_valid(host["host"]):
+                errors.append("Output's %s host %s has incorrect format" % (kind, host["host"]))
+
+    @staticmethod
+    def _is_http_host(host):
+        return Validator.is_url(host)
+
+    @staticmethod
+    def _is_tcp_host(host):
+        return Validator.is_hostname(host.split(":")[0])
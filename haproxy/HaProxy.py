@@ -1,9 +1,16 @@
 import csv
+import io
+import time
 from enum import Enum
-from itertools import groupby
 from urllib.request import urlopen
 
 
+# columns of the stats CSV read into Host
+COLUMNS = ("pxname", "svname", "scur", "smax", "bck", "status", "lastchg", "downtime")
+# columns read into Host when the stats page has them, qtime and rtime came with HaProxy 1.5
+OPTIONAL_COLUMNS = ("stot", "hrsp_5xx", "qtime", "rtime")
+
+
 class Dict2Object:
     @classmethod
     def from_dict(cls, dictionary):
@@ -25,7 +32,8 @@ class Status(Enum):
 
 class Host(Dict2Object):
     def __init__(self, backend_name=None, name=None, current_sessions=0, max_sessions=0, backend=False,
-                 status=Status.DOWN, last_status_change=0, downtime=0):
+                 status=Status.DOWN, last_status_change=0, downtime=0, total_sessions=0, responses_5xx=0,
+                 queue_time=0, response_time=0):
         # pxname
         self.backend_name = backend_name
         # svname
@@ -42,6 +50,14 @@ class Host(Dict2Object):
         self.last_status_change = last_status_change
         # downtime
         self.downtime = downtime
+        # stot
+        self.total_sessions = total_sessions
+        # hrsp_5xx
+        self.responses_5xx = responses_5xx
+        # qtime, average of the last 1024 requests in ms
+        self.queue_time = queue_time
+        # rtime, average of the last 1024 requests in ms
+        self.response_time = response_time
 
     def __str__(self):
         return "HaProxyHost {" \
@@ -58,9 +74,67 @@ class NotFoundHostException(Exception):
     pass
 
 
+class BackendAggregate:
+    def __init__(self, backend_name=None):
+        self.backend_name = backend_name
+        self.hosts = 0
+        self.up = 0
+        self.down = 0
+        self.current_sessions = 0
+        self.max_sessions = 0
+
+    def add(self, host: Host):
+        self.hosts += 1
+        if host.status == Status.UP:
+            self.up += 1
+        elif host.status == Status.DOWN:
+            self.down += 1
+        self.current_sessions += host.current_sessions
+        self.max_sessions += host.max_sessions
+
+    def __str__(self):
+        return "BackendAggregate {" \
+               "backend_name: " + str(self.backend_name) + ", " + \
+               "hosts: " + str(self.hosts) + ", " + \
+               "up: " + str(self.up) + ", " + \
+               "down: " + str(self.down) + ", " + \
+               "current_sessions: " + str(self.current_sessions) + ", " + \
+               "max_sessions: " + str(self.max_sessions) + \
+               "}"
+
+
 class HaProxy(Dict2Object):
-    def __init__(self, monitor_data={}):
+    """
+    Snapshot of a HaProxy stats page indexed by backend and svname: host lookups, hosts of a status and
+    backend aggregates are all O(1). Every load builds a new snapshot and replaces the previous one whole.
+    """
+
+    def __init__(self, monitor_data=None):
+        self.monitor_data = {}
+        self.hosts_by_name = {}
+        self.names_by_status = {}
+        self.available_hosts = {}
+        self.aggregates = {}
+        self.loaded_at = None
+        self.__index(monitor_data or {})
+
+    def __index(self, monitor_data):
+        hosts_by_name, names_by_status, available_hosts, aggregates = {}, {}, {}, {}
+        for backend_name, hosts in monitor_data.items():
+            hosts_by_name[backend_name] = {host.name: host for host in hosts}
+            statuses = names_by_status[backend_name] = {status: set() for status in Status}
+            aggregate = aggregates[backend_name] = BackendAggregate(backend_name)
+            for host in hosts:
+                statuses[host.status].add(host.name)
+                aggregate.add(host)
+            available_hosts[backend_name] = [host for host in hosts if host.status == Status.UP]
+
         self.monitor_data = monitor_data
+        self.hosts_by_name = hosts_by_name
+        self.names_by_status = names_by_status
+        self.available_hosts = available_hosts
+        self.aggregates = aggregates
+        self.loaded_at = time.time()
 
     def get_backend_names(self):
         return self.monitor_data.keys()
@@ -69,59 +143,68 @@ class HaProxy(Dict2Object):
         return self.monitor_data.get(backend_name)
 
     def get_available_hosts(self, backend_name):
-        available_hosts = list()
-        for host in self.get_hosts(backend_name):
-            if host.status == Status.UP:
-                available_hosts.append(host)
-        return available_hosts
-
-    def get_host(self, backend_name, host_name):
-        for host in self.get_hosts(backend_name):
-            if host.name == host_name:
-                return Host.from_dict(host)
-        raise NotFoundHostException("Not found host by name %s in backend name %s" % host_name, backend_name)
+        return list(self.available_hosts.get(backend_name, []))
+
+    def get_host_names(self, backend_name, status: Status):
+        return self.names_by_status.get(backend_name, {}).get(status, set())
+
+    def get_aggregate(self, backend_name) -> BackendAggregate:
+        return self.aggregates.get(backend_name)
+
+    def get_host(self, backend_name, host_name) -> Host:
+        host = self.hosts_by_name.get(backend_name, {}).get(host_name)
+        if host is None:
+            raise NotFoundHostException("Not found host by name %s in backend name %s" % (host_name, backend_name))
+        return host
 
     def load_from_file(self, filename, skip_backend=True):
-        with open(filename) as monitor:
+        with open(filename, newline='') as monitor:
             self.__load(monitor, skip_backend)
 
-    def load_from_url(self, url, skip_backend=True):
-        with urlopen(url) as monitor:
-            self.__load(monitor.read().decode('utf-8').splitlines(), skip_backend)
+    def load_from_url(self, url, skip_backend=True, timeout=None):
+        with urlopen(url, timeout=timeout) as monitor:
+            self.load_from_stream(monitor, skip_backend)
+
+    def load_from_stream(self, stream, skip_backend=True):
+        # the binary stream is decoded and parsed while it is read, it is never held whole in memory
+        self.__load(io.TextIOWrapper(stream, encoding='utf-8', newline=''), skip_backend)
 
     def __load(self, data, skip_backend):
-        # print(type(data))
-        reader = self.__csv_reader(data)
-        pxname = reader.fieldnames[0]
-        grouped = self.__group_by(reader, pxname)
-        for backend_name, hosts in grouped:
-            # print(backend_name)
-            backend_name_hosts = list()
-            for host_details in hosts:
-                # print(host_details)
-                host = Host()
-                host.backend_name = backend_name
-                host.name = host_details['svname']
-                host.current_sessions = self.__to_int(host_details['scur'])
-                host.max_sessions = self.__to_int(host_details['smax'])
-                host.backend = self.__to_bool(host_details['bck'])
-                host.status = Status.of(host_details['status'])
-                host.last_status_change = self.__to_int(host_details['lastchg'])
-                host.downtime = self.__to_int(host_details['downtime'])
-
-                if skip_backend and host.backend:
-                    pass
-                else:
-                    backend_name_hosts.append(host)
-
-            self.monitor_data[backend_name] = backend_name_hosts
-
-    def __csv_reader(self, data):
-        return csv.DictReader(data)
-
-    def __group_by(self, data, key):
-        rows = sorted(data, key=lambda row: row[key])
-        return groupby(rows, lambda row: row[key])
+        reader = csv.reader(data)
+        header = next(reader, None)
+        if not header:
+            self.__index({})
+            return
+        # the first column is "# pxname"
+        header[0] = header[0].lstrip("# ")
+        pxname, svname, scur, smax, bck, status, lastchg, downtime = (
+            header.index(column) for column in COLUMNS)
+        row_size = max(pxname, svname, scur, smax, bck, status, lastchg, downtime) + 1
+        # a missing optional column points past the row and reads as 0
+        stot, hrsp_5xx, qtime, rtime = (
+            header.index(column) if column in header else len(header) for column in OPTIONAL_COLUMNS)
+
+        to_int, to_bool, status_of = self.__to_int, self.__to_bool, Status.of
+        monitor_data = {}
+        for row in reader:
+            if len(row) < row_size:
+                continue
+            backend_name = row[pxname]
+            hosts = monitor_data.get(backend_name)
+            if hosts is None:
+                hosts = monitor_data[backend_name] = []
+            backend = to_bool(row[bck])
+            if skip_backend and backend:
+                continue
+            hosts.append(Host(backend_name, row[svname], to_int(row[scur]), to_int(row[smax]), backend,
+                              status_of(row[status]), to_int(row[lastchg]), to_int(row[downtime]),
+                              to_int(row[stot]) if stot < len(row) else 0,
+                              to_int(row[hrsp_5xx]) if hrsp_5xx < len(row) else 0,
+                              to_int(row[qtime]) if qtime < len(row) else 0,
+                              to_int(row[rtime]) if rtime < len(row) else 0))
+
+        # backends in name order, hosts in the order of the stats page
+        self.__index({backend_name: monitor_data[backend_name] for backend_name in sorted(monitor_data)})
 
     def __to_int(self, data, default=0):
         try:
@@ -0,0 +1,177 @@
+import bisect
+from array import array
+from operator import sub
+
+from haproxy.HaProxy import HaProxy
+
+# Host attributes recorded for every server, total_sessions and responses_5xx are counters which only
+# grow until HaProxy restarts, the others are gauges
+COLUMNS = ("current_sessions", "total_sessions", "responses_5xx", "queue_time", "response_time")
+
+
+class ServerHistory:
+    """
+    Last `capacity` snapshots of one server: a ring of timestamps and one ring per column, all in arrays
+    of doubles sharing one write position. Indexes count from the oldest snapshot, so the history bisects
+    by timestamp.
+    """
+    __slots__ = ("capacity", "timestamps", "columns", "start", "count", "last_seen")
+
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0]) * capacity
+        self.columns = {column: array("d", [0.0]) * capacity for column in columns}
+        self.start = 0
+        self.count = 0
+        self.last_seen = 0
+
+    def append(self, timestamp, host):
+        position = (self.start + self.count) % self.capacity
+        self.timestamps[position] = timestamp
+        for column, values in self.columns.items():
+            values[position] = getattr(host, column)
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.timestamps[(self.start + index) % self.capacity]
+
+    def first(self, since):
+        return bisect.bisect_left(self, since) if since is not None else 0
+
+    def window(self, values: array, first) -> array:
+        """
+        Values from index first to the newest in append order, copied by at most two array slices.
+        """
+        begin = (self.start + first) % self.capacity
+        end = begin + (self.count - first)
+        if end <= self.capacity:
+            return values[begin:end]
+        return values[begin:] + values[:end - self.capacity]
+
+
+def increase(values):
+    """
+    Increase of a counter over values, a value lower than the previous one means the counter was reset.
+    """
+    if len(values) < 2:
+        return 0.0
+    differences = list(map(sub, values[1:], values[:-1]))
+    if min(differences) >= 0:
+        return values[-1] - values[0]
+    return sum(difference if difference >= 0 else value
+               for difference, value in zip(differences, values[1:]))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+class HaProxyHistory:
+    """
+    Last `capacity` snapshots of every server (backend, svname), one ring buffer per column. Memory is
+    capacity * 8 * (len(columns) + 1) bytes per server whatever the uptime. A server missing from
+    `capacity` consecutive snapshots is dropped at the next check (every `capacity` snapshots), so replaced
+    servers don't pile up either.
+    Windows are the last `seconds` before the newest snapshot, or the whole history when seconds is None.
+    """
+
+    def __init__(self, capacity=360, columns=COLUMNS):
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self.backends = {}
+        self.snapshots = 0
+        self.latest = None
+
+    def append(self, haproxy: HaProxy, timestamp=None):
+        timestamp = timestamp if timestamp is not None else haproxy.loaded_at
+        self.snapshots += 1
+        self.latest = timestamp
+        for backend_name in haproxy.get_backend_names():
+            servers = self.backends.get(backend_name)
+            if servers is None:
+                servers = self.backends[backend_name] = {}
+            for host in haproxy.get_hosts(backend_name):
+                server = servers.get(host.name)
+                if server is None:
+                    server = servers[host.name] = ServerHistory(self.capacity, self.columns)
+                server.append(timestamp, host)
+                server.last_seen = self.snapshots
+
+        if self.snapshots % self.capacity == 0:
+            self.__drop_missing()
+
+    def __drop_missing(self):
+        for backend_name, servers in list(self.backends.items()):
+            for name in [name for name, server in servers.items()
+                         if self.snapshots - server.last_seen >= self.capacity]:
+                del servers[name]
+            if not servers:
+                del self.backends[backend_name]
+
+    def get_server_names(self, backend_name):
+        return list(self.backends.get(backend_name, {}).keys())
+
+    def __server(self, backend_name, name) -> ServerHistory:
+        return self.backends.get(backend_name, {}).get(name)
+
+    def values(self, backend_name, name, column, seconds=None) -> array:
+        server = self.__server(backend_name, name)
+        if server is None:
+            return array("d")
+        first = server.first(self.latest - seconds if seconds is not None else None)
+        return server.window(server.columns[column], first)
+
+    def increase(self, backend_name, name, counter, seconds=None):
+        return increase(self.values(backend_name, name, counter, seconds))
+
+    def rate(self, backend_name, name, counter, seconds=None):
+        """
+        Increase of a counter per second over the window, e.g. sessions/s of total_sessions.
+        None until the window has two snapshots.
+        """
+        server = self.__server(backend_name, name)
+        if server is None:
+            return None
+        first = server.first(self.latest - seconds if seconds is not None else None)
+        timestamps = server.window(server.timestamps, first)
+        if len(timestamps) < 2 or timestamps[-1] == timestamps[0]:
+            return None
+        return increase(server.window(server.columns[counter], first)) / (timestamps[-1] - timestamps[0])
+
+    def ratio(self, backend_name, name, numerator, denominator, seconds=None):
+        """
+        Increase of one counter per increase of another over the window, e.g. 5xx ratio of
+        responses_5xx and total_sessions. None when the denominator didn't increase.
+        """
+        total = self.increase(backend_name, name, denominator, seconds)
+        return self.increase(backend_name, name, numerator, seconds) / total if total else None
+
+    def percentile(self, backend_name, name, column, q, seconds=None):
+        return percentile(self.values(backend_name, name, column, seconds), q)
+
+    def backend_rate(self, backend_name, counter, seconds=None):
+        rates = [self.rate(backend_name, name, counter, seconds) for name in self.get_server_names(backend_name)]
+        rates = [rate for rate in rates if rate is not None]
+        return sum(rates) if rates else None
+
+    def backend_ratio(self, backend_name, numerator, denominator, seconds=None):
+        names = self.get_server_names(backend_name)
+        total = sum(self.increase(backend_name, name, denominator, seconds) for name in names)
+        if not total:
+            return None
+        return sum(self.increase(backend_name, name, numerator, seconds) for name in names) / total
+
+    def backend_percentile(self, backend_name, column, q, seconds=None):
+        values = array("d")
+        for name in self.get_server_names(backend_name):
+            values += self.values(backend_name, name, column, seconds)
+        return percentile(values, q)
@@ -0,0 +1,158 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, RemoteDisconnected
+from urllib.parse import urlsplit
+
+from haproxy.HaProxy import HaProxy
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PollTimeout(Exception):
+    pass
+
+
+class PollResult:
+    def __init__(self, name, url, haproxy: HaProxy = None, error=None, latency=0.0):
+        self.name = name
+        self.url = url
+        self.haproxy = haproxy
+        self.error = error
+        self.latency = latency
+
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        return "PollResult {" \
+               "name: " + str(self.name) + ", " + \
+               "url: " + str(self.url) + ", " + \
+               "error: " + str(self.error) + ", " + \
+               "latency: " + str(self.latency) + \
+               "}"
+
+
+class DeadlineReader(io.RawIOBase):
+    # every read of the response may only wait until the deadline of the whole fetch
+    def __init__(self, response, sock, deadline):
+        self.response = response
+        self.sock = sock
+        self.deadline = deadline
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise PollTimeout("Deadline exceeded")
+        try:
+            self.sock.settimeout(remaining)
+        except OSError:
+            # the connection closed its socket object for a response which ends the connection, reads keep
+            # the timeout set before the response and the deadline is checked between them
+            pass
+        return self.response.readinto(buffer)
+
+
+class Poller:
+    """
+    Fetches HaProxy stats pages of many monitors at once, at most `concurrency` at a time, so a cycle
+    takes about as long as the slowest monitor. Connections are kept alive per host between cycles and
+    every fetch, connecting included, has to finish in `timeout` seconds.
+    """
+
+    def __init__(self, concurrency=16, timeout=5.0, skip_backend=True):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.skip_backend = skip_backend
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="Poller")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        with self.lock:
+            connections = [connection for connections in self.idle.values() for connection in connections]
+            self.idle = {}
+        for connection in connections:
+            connection.close()
+
+    def __connection(self, scheme, netloc):
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                return connections.pop(), True
+        connection_class = HTTPSConnection if scheme == "https" else HTTPConnection
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def __release(self, scheme, netloc, connection):
+        with self.lock:
+            self.idle.setdefault((scheme, netloc), []).append(connection)
+
+    @staticmethod
+    def __until(connection, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise PollTimeout("Deadline exceeded")
+        connection.timeout = remaining
+        if connection.sock:
+            connection.sock.settimeout(remaining)
+
+    def fetch(self, name, url) -> PollResult:
+        started_at = time.monotonic()
+        deadline = started_at + self.timeout
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        while True:
+            connection, reused = self.__connection(parts.scheme, parts.netloc)
+            try:
+                self.__until(connection, deadline)
+                connection.request("GET", path, headers={"Connection": "keep-alive"})
+                self.__until(connection, deadline)
+                # the connection lets go of its socket when the server closes it after the response
+                sock = connection.sock
+                response = connection.getresponse()
+                if response.status != 200:
+                    response.read()
+                    raise HTTPException("HTTP %d %s" % (response.status, response.reason))
+                haproxy = HaProxy()
+                haproxy.load_from_stream(io.BufferedReader(DeadlineReader(response, sock, deadline),
+                                                           CHUNK_SIZE), self.skip_backend)
+            except (RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                connection.close()
+                if reused:
+                    # the server closed the idle connection, try once more on a new one
+                    continue
+                return PollResult(name, url, error=str(e) or e.__class__.__name__,
+                                  latency=time.monotonic() - started_at)
+            except Exception as e:
+                connection.close()
+                if isinstance(e, (PollTimeout, TimeoutError)):
+                    e = PollTimeout("No complete answer in %.1fs" % self.timeout)
+                return PollResult(name, url, error=str(e) or e.__class__.__name__,
+                                  latency=time.monotonic() - started_at)
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.__release(parts.scheme, parts.netloc, connection)
+            return PollResult(name, url, haproxy, latency=time.monotonic() - started_at)
+
+    def poll(self, monitors):
+        """
+        Fetches every monitor of a {name: url} dictionary, returns {name: PollResult}.
+        """
+        futures = {name: self.executor.submit(self.fetch, name, url) for name, url in monitors.items()}
+        return {name: future.result() for name, future in futures.items()}
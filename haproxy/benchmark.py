@@ -0,0 +1,149 @@
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from itertools import groupby
+from urllib.request import urlopen
+
+from haproxy.HaProxy import HaProxy, Host, Status
+
+EXAMPLE_MONITOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_haproxy_monitor.csv")
+
+
+class LegacyHaProxy(HaProxy):
+    # loader before streaming: whole response decoded and split, DictReader, sort and groupby
+    def load_from_url(self, url, skip_backend=True):
+        with urlopen(url) as monitor:
+            self.load_lines(monitor.read().decode('utf-8').splitlines(), skip_backend)
+
+    def load_from_file(self, filename, skip_backend=True):
+        with open(filename) as monitor:
+            self.load_lines(monitor, skip_backend)
+
+    def load_lines(self, data, skip_backend):
+        reader = csv.DictReader(data)
+        pxname = reader.fieldnames[0]
+        rows = sorted(reader, key=lambda row: row[pxname])
+        monitor_data = {}
+        for backend_name, hosts in groupby(rows, lambda row: row[pxname]):
+            backend_name_hosts = list()
+            for host_details in hosts:
+                host = Host()
+                host.backend_name = backend_name
+                host.name = host_details['svname']
+                host.current_sessions = int(host_details['scur'] or 0)
+                host.max_sessions = int(host_details['smax'] or 0)
+                host.backend = "1" == host_details['bck']
+                host.status = Status.of(host_details['status'])
+                host.last_status_change = int(host_details['lastchg'] or 0)
+                host.downtime = int(host_details['downtime'] or 0)
+                if not (skip_backend and host.backend):
+                    backend_name_hosts.append(host)
+            monitor_data[backend_name] = backend_name_hosts
+        HaProxy.__init__(self, monitor_data)
+
+
+def synthetic_monitor(path, servers, servers_per_backend=50):
+    """
+    Writes a stats CSV with `servers` servers made of the server rows of example_haproxy_monitor.csv,
+    with a FRONTEND and a BACKEND row for every backend like HaProxy writes them.
+    """
+    with open(EXAMPLE_MONITOR, newline='') as example:
+        rows = list(csv.reader(example))
+    header, rows = rows[0], [row for row in rows[1:] if row]
+    servers_rows = [row for row in rows if row[1] not in ("FRONTEND", "BACKEND")]
+    frontend = next(row for row in rows if row[1] == "FRONTEND")
+    backend = next(row for row in rows if row[1] == "BACKEND")
+
+    with open(path, "w", newline='') as monitor:
+        writer = csv.writer(monitor)
+        writer.writerow(header)
+        for number in range(0, servers, servers_per_backend):
+            backend_name = "backend_%d" % (number // servers_per_backend)
+            writer.writerow([backend_name, "FRONTEND"] + frontend[2:])
+            for server in range(number, min(servers, number + servers_per_backend)):
+                row = servers_rows[server % len(servers_rows)]
+                writer.writerow([backend_name, "server-%d" % server] + row[2:])
+            writer.writerow([backend_name, "BACKEND"] + backend[2:])
+    return os.path.getsize(path)
+
+
+def start_monitor_server(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = HTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="MonitorServer", daemon=True).start()
+    return server
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(load, runs):
+    samples = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        load()
+        samples.append(time.perf_counter() - started_at)
+    tracemalloc.start()
+    load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(samples), sum(samples) / len(samples), peak
+
+
+def benchmark(sizes, runs):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="haproxy-benchmark-") as directory:
+        server = start_monitor_server(directory)
+        try:
+            for servers in sizes:
+                name = "monitor_%d.csv" % servers
+                size = synthetic_monitor(os.path.join(directory, name), servers)
+                url = "http://127.0.0.1:%d/%s" % (server.server_port, name)
+                for loader in (HaProxy, LegacyHaProxy):
+                    for source, load in (("file", lambda: loader().load_from_file(os.path.join(directory, name))),
+                                         ("url", lambda: loader().load_from_url(url))):
+                        fastest, mean, peak = measure(load, runs)
+                        results.append({
+                            "loader": loader.__name__,
+                            "source": source,
+                            "servers": servers,
+                            "bytes": size,
+                            "runs": runs,
+                            "min": fastest,
+                            "mean": mean,
+                            "peak_memory": peak
+                        })
+        finally:
+            server.shutdown()
+    return results
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='HaProxy stats loader benchmark on synthetic stats pages',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--servers', type=int, action='append', default=None,
+                        help='Number of servers of a synthetic stats page, repeat for several sizes '
+                             '(default 12500, 25000, 50000).')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs of every loader.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(json.dumps({
+        "python": sys.version.split()[0],
+        "timestamp": time.time(),
+        "results": benchmark(args.servers or [12500, 25000, 50000], args.runs)
+    }, indent=4))
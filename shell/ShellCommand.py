@@ -1,13 +1,64 @@
-from subprocess import Popen, PIPE, CalledProcessError
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, PIPE, CalledProcessError, TimeoutExpired
+
+CHUNK_SIZE = 64 * 1024
+SPILL_THRESHOLD = 1024 * 1024
+
+
+class OutputBuffer:
+    """
+    Output of a stream kept in memory up to `threshold` bytes, spilled to a temporary file above it.
+    Spilled files are kept until ShellCommand.cleanup(), so their path can be handed over.
+    """
+
+    def __init__(self, threshold=SPILL_THRESHOLD):
+        self.threshold = threshold
+        self.head = bytearray()
+        self.file = None
+        self.path = None
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.file is None:
+            if len(self.head) + len(chunk) <= self.threshold:
+                self.head += chunk
+                return
+            self.file = tempfile.NamedTemporaryFile(prefix="shell-command-", suffix=".out", delete=False)
+            self.path = self.file.name
+            self.file.write(self.head)
+            self.head += chunk[:self.threshold - len(self.head)]
+        self.file.write(chunk)
+
+    def drain(self, stream):
+        # read1 returns what is available, output of a command whose pipe stays open isn't held back
+        for chunk in iter(lambda: stream.read1(CHUNK_SIZE), b""):
+            self.write(chunk)
+        stream.close()
+        if self.file:
+            self.file.close()
+
+    def text(self):
+        # whole output when it fits the threshold, the first `threshold` bytes of it otherwise
+        return bytes(self.head).decode('utf-8', errors='replace').strip()
 
 
 class ShellCommand:
     returncode = 0
     stdout = None
     stderr = None
+    stdout_path = None
+    stderr_path = None
+    timed_out = False
 
-    def __init__(self, command):
+    def __init__(self, command, timeout=None, spill_threshold=SPILL_THRESHOLD):
         self.command = command
+        self.timeout = timeout
+        self.spill_threshold = spill_threshold
 
     def __str__(self):
         return "ShellCommand(" \
@@ -22,22 +73,92 @@ class ShellCommand:
                )
 
     def execute(self):
+        """
+        Runs the command, draining stdout and stderr while it runs, so output larger than a pipe buffer
+        can't block it. After `timeout` seconds the whole process group is killed and timed_out is set.
+        Background processes the command leaves behind keep running, if they hold its stdout or stderr the
+        output is read for `timeout` more seconds and returned as far as it got.
+        Output above `spill_threshold` bytes is written to stdout_path/stderr_path, stdout/stderr keep its start.
+        """
         p = None
         try:
-            p = Popen(self.command, stdout=PIPE, stderr=PIPE, shell=True)
-            p.wait()
+            p = Popen(self.command, stdout=PIPE, stderr=PIPE, shell=True, start_new_session=True)
+            stdout, stderr = OutputBuffer(self.spill_threshold), OutputBuffer(self.spill_threshold)
+            readers = [threading.Thread(target=buffer.drain, args=(stream,), name="ShellCommand-%s" % name,
+                                        daemon=True)
+                       for buffer, stream, name in ((stdout, p.stdout, "stdout"), (stderr, p.stderr, "stderr"))]
+            for reader in readers:
+                reader.start()
+
+            try:
+                p.wait(self.timeout)
+            except TimeoutExpired:
+                self.timed_out = True
+                self.__kill(p)
+                p.wait()
+            for reader in readers:
+                reader.join(self.timeout)
 
             self.returncode = p.returncode
-            self.stdout = p.stdout.read().decode('utf-8').strip()
-            self.stderr = p.stderr.read().decode('utf-8').strip()
+            self.stdout, self.stdout_path = stdout.text(), stdout.path
+            self.stderr, self.stderr_path = stderr.text(), stderr.path
             return self
         except CalledProcessError as e:
             raise Exception("Couldn't execute command: %s - %s" % (self.command, e.output))
         except Exception as e:
             raise Exception("Couldn't execute command: %s - %s" % (self.command, e))
         finally:
-            if p:
+            # only an exception leaves the shell unreaped, its pid still holds the group id, so the group
+            # signalled is still the command's one
+            if p and p.returncode is None:
+                self.__kill(p)
+                p.wait()
+
+    @staticmethod
+    def __kill(p):
+        # with shell=True the command runs in a child of the shell, kill the group started for it
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        for path in (self.stdout_path, self.stderr_path):
+            if path:
                 try:
-                    p.kill()
+                    os.remove(path)
                 except OSError:
                     pass
+        self.stdout_path = self.stderr_path = None
+
+
+class ShellCommandExecutor:
+    """
+    Runs batches of shell commands, at most `concurrency` at a time, each with its own timeout.
+    A command which can't be started gets returncode -1 and the error as stderr, the batch goes on.
+    """
+
+    def __init__(self, concurrency=8, timeout=None, spill_threshold=SPILL_THRESHOLD):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.spill_threshold = spill_threshold
+
+    def _execute(self, command: ShellCommand):
+        try:
+            return command.execute()
+        except Exception as e:
+            command.returncode = -1
+            command.stderr = str(e)
+            return command
+
+    def execute(self, commands):
+        """
+        Executes commands (strings or ShellCommand) and returns ShellCommand results in the same order.
+        """
+        commands = [command if isinstance(command, ShellCommand)
+                    else ShellCommand(command, self.timeout, self.spill_threshold) for command in commands]
+        if not commands:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(commands)),
+                                thread_name_prefix="ShellCommandExecutor") as executor:
+            return list(executor.map(self._execute, commands))
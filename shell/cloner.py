@@ -48,11 +48,12 @@ class Command:
             raise e
         else:
             with self.proc:
-                self.proc.wait(self.timeout)
+                # reads both pipes while waiting, output larger than a pipe buffer would block wait()
+                stdout, stderr = self.proc.communicate(timeout=self.timeout)
 
                 self.return_code = self.proc.returncode
-                self.stdout = self.proc.stdout.read().decode('utf-8').strip()
-                self.stderr = self.proc.stderr.read().decode('utf-8').strip()
+                self.stdout = stdout.decode('utf-8').strip()
+                self.stderr = stderr.decode('utf-8').strip()
 
                 return self
         finally: